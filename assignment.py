@@ -0,0 +1,119 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.spatial import cKDTree
+
+
+class NearestAssigner:
+    """Assign items to the nearest generator, i.e. the owner of their Voronoi cell.
+
+    Built once per frame over the generator positions; each query is
+    O(log N) per item and covers the whole plane, so items on cell boundaries
+    or in cells that failed to clip are still assigned.
+
+    With weights, items go to the smallest power distance |q - p|^2 - w,
+    i.e. the owner of their power cell (see power.py). Each generator is
+    then lifted to (p, sqrt(max(w) - w)) and the query point to (q, 0), which
+    turns the power distance into a Euclidean one shifted by max(w).
+    """
+    def __init__(self, points, owners=None, weights=None):
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if owners is None:
+            owners = np.arange(len(self.points))
+        self.owners = np.asarray(owners)
+        self.lifted = weights is not None and len(self.points) > 0
+        if self.lifted:
+            weights = np.broadcast_to(np.asarray(weights, dtype=float), len(self.points))
+            height = np.sqrt(weights.max() - weights)
+            self.points = np.column_stack([self.points, height])
+        self.tree = cKDTree(self.points) if len(self.points) > 0 else None
+
+    def query(self, positions):
+        """Owner of the nearest generator for every position, -1 if there is none.
+
+        Ties between equidistant generators go to the lowest owner index.
+        """
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        result = np.full(len(positions), -1, dtype=np.int64)
+        if self.tree is None or len(positions) == 0:
+            return result
+        if self.lifted:
+            positions = np.column_stack([positions, np.zeros(len(positions))])
+        k = min(2, len(self.points))
+        dist, idx = self.tree.query(positions, k=k)
+        dist, idx = dist.reshape(len(positions), k), idx.reshape(len(positions), k)
+        result[:] = self.owners[idx[:, 0]]
+
+        if k == 2:
+            tol = 1e-9 * np.maximum(dist[:, 0], 1.0)
+            for row in np.flatnonzero(dist[:, 1] - dist[:, 0] <= tol):
+                candidates = self.tree.query_ball_point(positions[row], dist[row, 0] + tol[row])
+                result[row] = self.owners[candidates].min()
+        return result
+
+
+class BatchAssigner:
+    """Assign detected items in batches, matching them one-to-one with free cars.
+
+    Items are collected with offer() for `window` ticks after the oldest
+    one arrived; match() then solves scipy.optimize.linear_sum_assignment
+    on cost = distance + workload_cost * workload, so simultaneous items
+    are spread over neighbouring cars instead of all going to one of them.
+    Only the `candidates` nearest cars of every item (one KD-tree query)
+    enter the problem, which keeps the matrix at most items x
+    (candidates * items) whatever the number of cars. Items that get no
+    car stay pending for the next batch.
+    """
+    def __init__(self, window=0, candidates=8, workload_cost=50.0):
+        self.window = window
+        self.candidates = candidates
+        self.workload_cost = workload_cost
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def offer(self, item, tick):
+        """Queue a detected item; items already queued keep their place."""
+        self._pending.setdefault(item.serial, (item, tick))
+
+    def ready(self, tick):
+        """Whether the oldest pending item has waited a full window."""
+        return bool(self._pending) and tick - min(t for _, t in self._pending.values()) >= self.window
+
+    def pending(self):
+        """Items still waiting for a car, oldest first; picked items are dropped."""
+        for serial in [s for s, (item, _) in self._pending.items() if item.picked]:
+            del self._pending[serial]
+        return [item for item, _ in self._pending.values()]
+
+    def settle(self, item):
+        """Remove an item that got its car."""
+        self._pending.pop(item.serial, None)
+
+    def match(self, positions, points, owners, workload=0.0):
+        """Owner matched to every position, -1 if it gets none.
+
+        points are the free cars, owners their indices and workload their
+        current load (e.g. tasks done), in the same order.
+        """
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        result = np.full(len(positions), -1, dtype=np.int64)
+        if len(positions) == 0 or len(points) == 0:
+            return result
+        k = min(self.candidates, len(points))
+        dist, idx = cKDTree(points).query(positions, k=k)
+        dist, idx = dist.reshape(len(positions), k), idx.reshape(len(positions), k)
+        workload = np.broadcast_to(np.asarray(workload, dtype=float), len(points))
+        allowed = dist + self.workload_cost * workload[idx]
+
+        # Cars outside every candidate list drop out; pairs outside a list
+        # cost more than any full matching, so as many items as possible are matched
+        cols, inverse = np.unique(idx.ravel(), return_inverse=True)
+        forbidden = (allowed.max() + 1.0) * (min(len(positions), len(cols)) + 1)
+        cost = np.full((len(positions), len(cols)), forbidden)
+        cost[np.repeat(np.arange(len(positions)), k), inverse] = allowed.ravel()
+        rows, picks = linear_sum_assignment(cost)
+        ok = cost[rows, picks] < forbidden
+        result[rows[ok]] = np.asarray(owners)[cols[picks[ok]]]
+        return result
@@ -0,0 +1,153 @@
+import heapq
+import math
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class DetectionScheduler:
+    """Precomputed drone detection frames for items.
+
+    The drone flies its zigzag at constant speed along a robots.ArcPath, so
+    the stretches of the sweep within sensor_range of an item are arc
+    length intervals, at most one per straight leg, that come round every
+    lap. The first frame falling in one of them is worked out when the item
+    spawns. Scheduled items wait in a priority queue and due() only pops
+    the ones detected at the current frame.
+
+    Frame f is the state after the f-th call to Drone.update() from when
+    the scheduler was made, i.e. the f-th physics step of the simulation
+    clock (simclock.SimClock.ticks).
+    """
+    def __init__(self, drone, max_laps=64):
+        self.drone = drone
+        self.sensor_range = drone.sensor_range
+        self.speed = drone.step_length
+        self.max_laps = max_laps
+        self._t0 = drone.ticks
+        arc = drone.arc
+        # Leg 0 leads from the start onto the sweep and is flown once
+        legs = slice(arc.first[0], arc.last[0] + 1)
+        self.leg_origin = arc.origin[legs]
+        self.leg_dir = arc.direction[legs]
+        self.leg_start = arc.start[legs]
+        self.leg_length = arc.length[legs]
+        self.period = arc.period[0]
+        self._queue = []
+
+    def position(self, frame):
+        """Drone position at the given frame."""
+        return self.drone.position_at(self._t0 + frame)
+
+    def _in_range(self, x, y, frame):
+        px, py = self.position(frame)
+        return math.hypot(x - px, y - py) <= self.sensor_range
+
+    def _search(self, x, y, lo):
+        """First frame >= lo with the item in range, or None within max_laps laps."""
+        r = self.sensor_range
+        rel = np.array([x, y]) - self.leg_origin
+        along = np.einsum('ij,ij->i', rel, self.leg_dir)
+        off_sq = np.einsum('ij,ij->i', rel, rel) - along ** 2
+        reach = np.sqrt(np.maximum(r * r - off_sq, 0.0))
+        hits = (off_sq <= r * r) & (along + reach >= 0) & (along - reach <= self.leg_length)
+        if not hits.any():
+            return None
+        enter = self.leg_start + np.clip(along - reach, 0.0, self.leg_length)
+        leave = self.leg_start + np.clip(along + reach, 0.0, self.leg_length)
+
+        # Step k sits at arc length k * speed; move every leg to the first lap ending after lo
+        lo_arc = (self._t0 + lo) * self.speed
+        lap = np.zeros(len(enter))
+        laps = 1
+        if self.period > 0:
+            lap[1:] = np.maximum(0.0, np.ceil((lo_arc - leave[1:]) / self.period))
+            laps = self.max_laps
+        for extra in range(laps):
+            shift = (lap + extra) * self.period
+            shift[0] = 0.0
+            step = np.ceil(np.maximum(enter + shift, lo_arc) / self.speed)
+            inside = hits & (step * self.speed <= leave + shift)
+            if extra:
+                inside[0] = False
+            if inside.any():
+                break
+        else:
+            return None
+        candidate = max(lo, int(step[inside].min()) - self._t0)
+
+        # Confirm against the exact positions, guarding against rounding
+        while candidate > lo and self._in_range(x, y, candidate - 1):
+            candidate -= 1
+        if not self._in_range(x, y, candidate):
+            return self._search(x, y, candidate + 1)
+        return candidate
+
+    def first_detection(self, x, y, frame):
+        """First frame >= frame at which (x, y) is within sensor range, or None."""
+        return self._search(x, y, frame)
+
+    def schedule(self, key, x, y, frame):
+        """Queue key for the first frame >= frame at which (x, y) is detected."""
+        detect_frame = self.first_detection(x, y, frame)
+        if detect_frame is not None:
+            heapq.heappush(self._queue, (detect_frame, key))
+        return detect_frame
+
+    def due(self, frame):
+        """Pop the keys detected at or before frame, in key order."""
+        keys = []
+        while self._queue and self._queue[0][0] <= frame:
+            keys.append(heapq.heappop(self._queue)[1])
+        return sorted(keys)
+
+
+class SweepDetector:
+    """Detection of queued items by all drones of a DroneFleet.
+
+    Same interface as DetectionScheduler, for drones whose sweeps are not
+    worth tracing one by one. due() checks every queued item against the
+    sensor disks of every drone at every physics step since the previous
+    call (robots.DroneFleet.position_at), in one KD-tree range query, so
+    no pass over an item is skipped when a frame spans several steps.
+    """
+    def __init__(self, drones):
+        self.drones = drones
+        self._seen = drones.ticks
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._pos = np.zeros((0, 2))
+        self._from = np.zeros(0, dtype=np.int64)
+        self._new = []
+
+    def __len__(self):
+        return len(self._keys) + len(self._new)
+
+    def schedule(self, key, x, y, frame):
+        """Queue key until it is in range at some frame >= frame."""
+        self._new.append((key, x, y, frame))
+
+    def due(self, frame):
+        """Pop the keys of queued items in sensor range at a step since the last call, in key order."""
+        if self._new:
+            keys, xs, ys, frames = zip(*self._new)
+            self._keys = np.concatenate([self._keys, keys])
+            self._pos = np.concatenate([self._pos, np.column_stack([xs, ys])])
+            self._from = np.concatenate([self._from, frames])
+            self._new = []
+        ticks = np.arange(self._seen + 1, self.drones.ticks + 1)
+        self._seen = self.drones.ticks
+        if len(self._keys) == 0 or len(ticks) == 0:
+            return []
+        # Frame of every step, taking the drones' last step as the current frame
+        steps = frame - self.drones.ticks + ticks
+        sweep = self.drones.position_at(ticks).reshape(-1, 2)
+        pairs = cKDTree(self._pos).sparse_distance_matrix(
+            cKDTree(sweep), self.drones.sensor_range, output_type='ndarray')
+        step = steps[pairs['j'] // len(self.drones)]
+        hit = np.zeros(len(self._keys), dtype=bool)
+        hit[pairs['i'][step >= self._from[pairs['i']]]] = True
+        if not hit.any():
+            return []
+        keys = np.sort(self._keys[hit]).tolist()
+        keep = ~hit
+        self._keys, self._pos, self._from = self._keys[keep], self._pos[keep], self._from[keep]
+        return keys
@@ -0,0 +1,165 @@
+import json
+import threading
+import numpy as np
+
+DEBUG = 10
+INFO = 20
+
+DETECT = 1
+ASSIGN = 2
+PICKUP = 3
+DEPART = 4
+DELIVER = 5
+SPAWN = 6
+
+KIND_NAMES = {DETECT: 'detect', ASSIGN: 'assign', PICKUP: 'pickup',
+              DEPART: 'depart', DELIVER: 'deliver', SPAWN: 'spawn'}
+KIND_LEVELS = {DETECT: DEBUG, ASSIGN: INFO, PICKUP: INFO,
+               DEPART: DEBUG, DELIVER: INFO, SPAWN: DEBUG}
+LEVELS = {'debug': DEBUG, 'info': INFO}
+
+EVENT_DTYPE = np.dtype([
+    ('frame', np.int64),
+    ('kind', np.uint8),
+    ('car', np.int32),
+    ('item', np.int64),
+    ('x', np.float64),
+    ('y', np.float64),
+])
+
+
+class EventLog:
+    """Structured event sink with a ring buffer and a background writer thread.
+
+    emit() only stores a fixed-size record in a preallocated ring buffer; a
+    daemon thread drains it every `interval` seconds and hands the records to
+    the consumers (JsonlSink, BinarySink, ConsoleSink, ...). Events below
+    `level` are dropped at emit time. If the ring fills up, the emitting
+    thread drains it itself rather than losing events.
+
+    Call sites check `enabled` before building an event, so a log created
+    with enabled=False (or NULL_LOG) costs a single attribute test.
+    """
+    def __init__(self, consumers=(), level=INFO, capacity=4096, interval=0.2, enabled=True):
+        self.consumers = list(consumers)
+        self.level = level
+        self.enabled = enabled and bool(self.consumers)
+        self.frame = 0
+        self._ring = np.zeros(capacity, dtype=EVENT_DTYPE)
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._interval = interval
+        self._thread = None
+        if self.enabled:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def emit(self, kind, car=-1, item=-1, x=np.nan, y=np.nan):
+        """Record an event at the current frame."""
+        if KIND_LEVELS[kind] < self.level:
+            return
+        with self._lock:
+            full = self._count == len(self._ring)
+        if full:
+            self.drain()
+        with self._lock:
+            slot = (self._head + self._count) % len(self._ring)
+            self._ring[slot] = (self.frame, kind, car, item, x, y)
+            self._count += 1
+
+    def _take(self):
+        """Remove and return the buffered records in order."""
+        with self._lock:
+            end = self._head + self._count
+            if end <= len(self._ring):
+                batch = self._ring[self._head:end].copy()
+            else:
+                batch = np.concatenate([self._ring[self._head:], self._ring[:end - len(self._ring)]])
+            self._head = end % len(self._ring)
+            self._count = 0
+        return batch
+
+    def drain(self):
+        """Pass every buffered record to the consumers."""
+        with self._drain_lock:
+            batch = self._take()
+            if len(batch) > 0:
+                for consumer in self.consumers:
+                    consumer(batch)
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self._interval)
+            self.drain()
+
+    def close(self):
+        """Stop the writer thread, drain the remaining records and close the consumers."""
+        if self._thread is None:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        self.drain()
+        for consumer in self.consumers:
+            if hasattr(consumer, 'close'):
+                consumer.close()
+
+
+NULL_LOG = EventLog(enabled=False)
+
+
+class JsonlSink:
+    """Write every event as one JSON object per line."""
+    def __init__(self, path):
+        self.file = open(path, 'w')
+
+    def __call__(self, batch):
+        for record in batch.tolist():
+            frame, kind, car, item, x, y = record
+            event = {'frame': frame, 'kind': KIND_NAMES[kind]}
+            if car >= 0:
+                event['car'] = car
+            if item >= 0:
+                event['item'] = item
+            if x == x:
+                event['x'], event['y'] = x, y
+            self.file.write(json.dumps(event) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class BinarySink:
+    """Append events as raw EVENT_DTYPE records (read back with np.fromfile)."""
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+
+    def __call__(self, batch):
+        batch.tofile(self.file)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ConsoleSink:
+    """Print events as the human-readable messages the simulation used to print."""
+    MESSAGES = {
+        DETECT: "Drone has detected item {item}.",
+        ASSIGN: "Car at ({x:.2f}, {y:.2f}) has been assigned to pick up item {item}.",
+        PICKUP: "Car at ({x:.2f}, {y:.2f}) has picked up the item.",
+        DEPART: "Car at ({x:.2f}, {y:.2f}) is delivering the item.",
+        DELIVER: "Car at ({x:.2f}, {y:.2f}) has delivered the item.",
+        SPAWN: "A new item has appeared.",
+    }
+
+    def __call__(self, batch):
+        lines = [self.MESSAGES[kind].format(item=item + 1, x=x, y=y)
+                 for _, kind, _, item, x, y in batch.tolist()]
+        print('\n'.join(lines))
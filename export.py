@@ -0,0 +1,86 @@
+import multiprocessing
+import os
+import pygame
+from PIL import Image
+
+
+def _encode_frames(jobs, results, path, gif, duration):
+    """Worker process: encode queued frames to PNG files or one animated GIF."""
+    frames = []
+    count = 0
+    try:
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            frame, size, data = job
+            image = Image.frombytes('RGB', size, data)
+            if gif:
+                frames.append(image.quantize(colors=64))
+            else:
+                image.save(os.path.join(path, f"frame_{frame:06d}.png"))
+            count += 1
+        if frames:
+            frames[0].save(path, save_all=True, append_images=frames[1:], duration=duration, loop=0)
+        results.put((count, None))
+    except Exception as e:
+        results.put((count, repr(e)))
+
+
+class FrameExporter:
+    """Decimated off-screen frame export, encoded in a background process.
+
+    Every `every`-th frame is drawn into an off-screen surface (no window is
+    needed), scaled, copied to raw RGB bytes and queued. A worker process
+    encodes the frames while the simulation keeps running; being a separate
+    process, the encoder never competes with the simulation for the GIL. A
+    path ending in .gif becomes an animated GIF written when the run is
+    closed, any other path is a directory receiving a PNG sequence. At most
+    max_pending frames wait in the queue; when the worker falls behind,
+    submit() blocks.
+    """
+    def __init__(self, path, size, every=6, fps=60, scale=1.0, max_pending=32):
+        self.path = path
+        self.every = every
+        self.surface = pygame.Surface((size, size))
+        self.out_size = (max(1, round(size * scale)),) * 2
+        self.count = 0
+        gif = path.lower().endswith('.gif')
+        directory = os.path.dirname(path) if gif else path
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        ctx = multiprocessing.get_context()
+        self._jobs = ctx.Queue(max_pending)
+        self._results = ctx.Queue()
+        self._worker = ctx.Process(target=_encode_frames, daemon=True,
+                                   args=(self._jobs, self._results, path, gif,
+                                         round(1000 * every / fps)))
+        self._worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def wants(self, frame):
+        """Whether frame (counted from 1) is one of the exported frames."""
+        return (frame - 1) % self.every == 0
+
+    def submit(self, frame, surface=None):
+        """Queue the contents of surface (default: self.surface) as frame."""
+        surface = self.surface if surface is None else surface
+        if surface.get_size() != self.out_size:
+            surface = pygame.transform.smoothscale(surface, self.out_size)
+        self._jobs.put((frame, self.out_size, pygame.image.tobytes(surface, 'RGB')))
+
+    def close(self):
+        """Wait until every queued frame is encoded and written."""
+        if self._worker is None:
+            return
+        self._jobs.put(None)
+        self.count, error = self._results.get()
+        self._worker.join()
+        self._worker = None
+        if error is not None:
+            raise RuntimeError(f"frame export to {self.path} failed: {error}")
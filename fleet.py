@@ -0,0 +1,205 @@
+import math
+import numpy as np
+from scipy.spatial import cKDTree
+from utils import uniform
+from events import NULL_LOG, PICKUP, DEPART, DELIVER
+from profiling import NULL_PROFILER
+
+# State bits stored in Fleet.state
+HAS_ITEM = 1
+DELIVERING = 2
+ASSIGNED = 4
+JUST_DELIVERED = 8
+
+DEPOT_RADIUS = 40
+REPULSION_RANGE = 50
+# Repulsive velocity in units per second at unit distance (x dt per step)
+REPULSION_GAIN = 90000
+
+
+def repulsion_forces(pos, cutoff=REPULSION_RANGE, gain=REPULSION_GAIN, double_count=True):
+    """Repulsive force on every point from all neighbours within cutoff.
+
+    Neighbour pairs come from a single KD-tree query and forces are
+    accumulated with scatter-adds, so the cost grows roughly linearly with the
+    number of cars. With double_count=True each pair is applied from both
+    sides, which is what the original per-car loop did.
+    """
+    n = len(pos)
+    force = np.zeros((n, 2))
+    if n < 2:
+        return force
+    pairs = cKDTree(pos).query_pairs(cutoff, output_type='ndarray')
+    if len(pairs) == 0:
+        return force
+    i, j = pairs[:, 0], pairs[:, 1]
+    diff = pos[i] - pos[j]
+    dist = np.hypot(diff[:, 0], diff[:, 1])
+    magnitude = gain / (dist ** 2 + 1e-8) / (dist + 1e-8)
+    if double_count:
+        magnitude *= 2
+    for axis in range(2):
+        f = magnitude * diff[:, axis]
+        force[:, axis] = np.bincount(i, f, n) - np.bincount(j, f, n)
+    return force
+
+
+def _serial(item):
+    return -1 if item.serial is None else item.serial
+
+
+class Fleet:
+    """Structure-of-arrays store holding the state of every car.
+
+    Positions, velocities (dx_total, dy_total), targets (centroid) and the
+    state bitmask live in contiguous NumPy arrays; Car objects are thin views
+    onto one row of them. rng is the NumPy Generator used for delivery
+    points; without one the global random module is used. Pickups and
+    deliveries are reported to the events log (an events.EventLog), and the
+    repulsion is timed by `profiler` (a profiling.Profiler) if one is given.
+    """
+    _ROW_FIELDS = {
+        'pos': ((2,), np.float64),
+        'vel': ((2,), np.float64),
+        'target': ((2,), np.float64),
+        'item_pos': ((2,), np.float64),
+        'last_pos': ((2,), np.float64),
+        'speed': ((), np.float64),
+        'size': ((), np.float64),
+        'reach': ((), np.float64),
+        'odometer': ((), np.float64),
+        'state': ((), np.uint8),
+    }
+
+    def __init__(self, env_size, capacity=16, double_count_repulsion=True, rng=None, events=None,
+                 profiler=None, dt=1 / 60):
+        self.env_size = env_size
+        self.dt = dt
+        self.rng = rng
+        self.events = NULL_LOG if events is None else events
+        self.profiler = NULL_PROFILER if profiler is None else profiler
+        self.double_count_repulsion = double_count_repulsion
+        self.n = 0
+        self.cars = []
+        self._buffers = {}
+        for name, (shape, dtype) in self._ROW_FIELDS.items():
+            self._buffers[name] = np.zeros((capacity,) + shape, dtype=dtype)
+        self._refresh_views()
+
+    def __len__(self):
+        return self.n
+
+    def _refresh_views(self):
+        for name, buf in self._buffers.items():
+            setattr(self, name, buf[:self.n])
+
+    def add(self, car, x, y):
+        """Append a row for car and return its index."""
+        capacity = len(self._buffers['pos'])
+        if self.n == capacity:
+            for name, buf in self._buffers.items():
+                grown = np.zeros((2 * capacity,) + buf.shape[1:], dtype=buf.dtype)
+                grown[:capacity] = buf
+                self._buffers[name] = grown
+        idx = self.n
+        self.n += 1
+        self._refresh_views()
+        self.pos[idx] = (x, y)
+        self.last_pos[idx] = (x, y)
+        self.target[idx] = (x, y)
+        self.item_pos[idx] = np.nan
+        self.cars.append(car)
+        return idx
+
+    def has(self, bits):
+        """Boolean mask of cars with any of the given state bits set."""
+        return (self.state & bits) != 0
+
+    def set_bits(self, mask, bits):
+        self.state[mask] |= bits
+
+    def clear_bits(self, mask, bits):
+        self.state[mask] &= np.uint8(~bits & 0xFF)
+
+    def has_target_item(self):
+        return ~np.isnan(self.item_pos[:, 0])
+
+    def idle(self):
+        """Cars with no assignment, no item and no pending pickup."""
+        return ~self.has(ASSIGNED | DELIVERING | HAS_ITEM) & ~self.has_target_item()
+
+    def busy(self):
+        return self.has(ASSIGNED | DELIVERING)
+
+    def repulsion(self):
+        """Repulsive displacement of every car over one step, from its neighbours."""
+        return repulsion_forces(self.pos, gain=REPULSION_GAIN * self.dt,
+                                double_count=self.double_count_repulsion)
+
+    def step(self):
+        """Advance every car by one step of dt seconds.
+
+        Starts deliveries for cars that just picked up an item, applies
+        attraction and repulsion, clamps to the distance each car covers in
+        dt at its speed (units per second), integrates, then runs the
+        delivery and pickup checks. Returns the indices of cars that picked
+        up and delivered an item this step.
+        """
+        self.clear_bits(slice(None), JUST_DELIVERED)
+
+        starting = np.flatnonzero(self.has(HAS_ITEM) & ~self.has(DELIVERING))
+        for i in starting:
+            rad = math.radians(uniform(self.rng, 180, 270))
+            self.target[i] = (self.env_size + DEPOT_RADIUS * math.cos(rad),
+                              self.env_size + DEPOT_RADIUS * math.sin(rad))
+            if self.events.enabled:
+                self.events.emit(DEPART, car=i, x=self.pos[i, 0], y=self.pos[i, 1])
+        self.set_bits(starting, DELIVERING)
+
+        # Attraction towards the centroid (or delivery point)
+        step = self.speed * self.dt
+        delta = self.target - self.pos
+        dist = np.hypot(delta[:, 0], delta[:, 1])
+        gain = np.divide(np.minimum(dist, step), dist,
+                         out=np.zeros_like(dist), where=dist > 0)
+        self.vel[:] = delta * gain[:, None]
+        with self.profiler.span('repulsion'):
+            self.vel += self.repulsion()
+
+        total_speed = np.hypot(self.vel[:, 0], self.vel[:, 1])
+        fast = total_speed > step
+        self.vel[fast] *= (step[fast] / total_speed[fast])[:, None]
+
+        self.pos += self.vel
+        self.odometer += np.hypot(self.pos[:, 0] - self.last_pos[:, 0],
+                                  self.pos[:, 1] - self.last_pos[:, 1])
+        self.last_pos[:] = self.pos
+
+        # Delivery check
+        delta = self.target - self.pos
+        arrived = self.has(DELIVERING) & (np.hypot(delta[:, 0], delta[:, 1]) < step)
+        delivered = np.flatnonzero(arrived)
+        self.clear_bits(delivered, HAS_ITEM | DELIVERING | ASSIGNED)
+        self.set_bits(delivered, JUST_DELIVERED)
+        for i in delivered:
+            self.cars[i].item_color = None
+            if self.events.enabled:
+                self.events.emit(DELIVER, car=i, x=self.pos[i, 0], y=self.pos[i, 1])
+
+        # Pickup check
+        delta = self.item_pos - self.pos
+        with np.errstate(invalid='ignore'):
+            reached = np.hypot(delta[:, 0], delta[:, 1]) < self.reach
+        picked = np.flatnonzero(reached & ~self.has(HAS_ITEM))
+        self.set_bits(picked, HAS_ITEM)
+        for i in picked:
+            car = self.cars[i]
+            car.item_color = car.target_item.color
+            car.target_item.picked = True
+            car.current_item = car.target_item
+            car.target_item = None
+            if self.events.enabled:
+                self.events.emit(PICKUP, car=i, item=_serial(car.current_item),
+                                 x=self.pos[i, 0], y=self.pos[i, 1])
+
+        return picked, delivered
@@ -0,0 +1,144 @@
+import numpy as np
+
+LIFECYCLE_DTYPE = np.dtype([
+    ('serial', np.int64),
+    ('x', np.float64),
+    ('y', np.float64),
+    ('car', np.int64),
+    ('appear', np.int64),
+    ('detect', np.int64),
+    ('assign', np.int64),
+    ('pickup', np.int64),
+    ('deliver', np.int64),
+])
+
+EVENTS = ('appear', 'detect', 'assign', 'pickup')
+
+
+class LifecycleArchive:
+    """Append-only record of finished items, one LIFECYCLE_DTYPE row each.
+
+    Rows are buffered in a fixed-size chunk. Without a path full chunks are
+    kept in memory; with a path they are appended to that file as raw rows
+    and dropped, so memory stays bounded by the chunk size.
+    """
+    def __init__(self, path=None, chunk_size=1024):
+        self.path = path
+        self._chunk = np.zeros(chunk_size, dtype=LIFECYCLE_DTYPE)
+        self._used = 0
+        self._chunks = []
+        self._count = 0
+        if path is not None:
+            open(path, 'wb').close()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, row):
+        self._chunk[self._used] = row
+        self._used += 1
+        self._count += 1
+        if self._used == len(self._chunk):
+            self.flush()
+
+    def flush(self):
+        if self._used == 0:
+            return
+        full = self._chunk[:self._used].copy()
+        if self.path is None:
+            self._chunks.append(full)
+        else:
+            with open(self.path, 'ab') as f:
+                full.tofile(f)
+        self._used = 0
+
+    def records(self):
+        """All archived rows as one structured array."""
+        parts = list(self._chunks)
+        if self.path is not None:
+            parts.insert(0, np.fromfile(self.path, dtype=LIFECYCLE_DTYPE))
+        parts.append(self._chunk[:self._used])
+        return np.concatenate(parts)
+
+
+class ItemStore:
+    """Live items in compact slot arrays, with finished items archived.
+
+    Each item gets a serial number in creation order; slots freed by
+    delivered items are reused, so the arrays only grow with the number of
+    items alive at the same time.
+    """
+    def __init__(self, capacity=16, archive=None):
+        self.items = []
+        self.pos = np.zeros((0, 2))
+        self.serial = np.zeros(0, dtype=np.int64)
+        self.car = np.zeros(0, dtype=np.int64)
+        self.frames = {event: np.zeros(0, dtype=np.int64) for event in EVENTS}
+        self._free = []
+        self._slots = {}
+        self.created = 0
+        self.archive = archive if archive is not None else LifecycleArchive()
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        extra = capacity - len(self.items)
+        self.items.extend([None] * extra)
+        self.pos = np.vstack([self.pos, np.full((extra, 2), np.nan)])
+        self.serial = np.append(self.serial, np.full(extra, -1))
+        self.car = np.append(self.car, np.full(extra, -1))
+        for event in EVENTS:
+            self.frames[event] = np.append(self.frames[event], np.full(extra, -1))
+        self._free.extend(range(capacity - 1, capacity - extra - 1, -1))
+
+    def __len__(self):
+        return len(self._slots)
+
+    def add(self, item, frame):
+        """Store a new item appearing at frame and return its serial."""
+        if not self._free:
+            self._grow(2 * len(self.items))
+        slot = self._free.pop()
+        serial = self.created
+        self.created += 1
+        item.serial = serial
+        self.items[slot] = item
+        self.pos[slot] = (item.x, item.y)
+        self.serial[slot] = serial
+        self.car[slot] = -1
+        for event in EVENTS:
+            self.frames[event][slot] = -1
+        self.frames['appear'][slot] = frame
+        self._slots[serial] = slot
+        return serial
+
+    def get(self, serial):
+        """Live item with this serial, or None once it has been archived."""
+        slot = self._slots.get(serial)
+        return None if slot is None else self.items[slot]
+
+    def live(self):
+        return [item for item in self.items if item is not None]
+
+    def frame_of(self, serial, event):
+        return int(self.frames[event][self._slots[serial]])
+
+    def record(self, serial, event, frame, car=None):
+        """Record the first frame at which event happened to a live item."""
+        slot = self._slots[serial]
+        if self.frames[event][slot] < 0:
+            self.frames[event][slot] = frame
+            if car is not None:
+                self.car[slot] = car
+
+    def finish(self, serial, frame):
+        """Archive a delivered item, free its slot and return its lifecycle row."""
+        slot = self._slots.pop(serial)
+        row = (serial, self.pos[slot, 0], self.pos[slot, 1], self.car[slot],
+               self.frames['appear'][slot], self.frames['detect'][slot],
+               self.frames['assign'][slot], self.frames['pickup'][slot], frame)
+        self.archive.append(row)
+        self.items[slot] = None
+        self.pos[slot] = np.nan
+        self.serial[slot] = -1
+        self._free.append(slot)
+        return np.array(row, dtype=LIFECYCLE_DTYPE)
@@ -0,0 +1,305 @@
+import numpy as np
+from scipy.spatial import Delaunay
+from utils import clip_convex_cells, Cells
+from profiling import NULL_PROFILER
+
+# Vertex slots 0-3 of the triangulation hold the guard points, generator id k is slot k + GUARDS
+GUARDS = 4
+
+
+def _cross(b, c):
+    return b[:, 0] * c[:, 1] - b[:, 1] * c[:, 0]
+
+
+def incircle(a, b, c, d):
+    """Positive where d lies inside the circumcircle of the counter-clockwise triangle abc."""
+    ad, bd, cd = a - d, b - d, c - d
+    return (np.einsum('ij,ij->i', ad, ad) * _cross(bd, cd)
+            + np.einsum('ij,ij->i', bd, bd) * _cross(cd, ad)
+            + np.einsum('ij,ij->i', cd, cd) * _cross(ad, bd))
+
+
+def circumcenters(a, b, c):
+    """Circumcenters of the triangles abc and twice their signed areas."""
+    b, c = b - a, c - a
+    d = 2 * _cross(b, c)
+    b2 = np.einsum('ij,ij->i', b, b)
+    c2 = np.einsum('ij,ij->i', c, c)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        center = np.column_stack([c[:, 1] * b2 - b[:, 1] * c2, b[:, 0] * c2 - c[:, 0] * b2]) / d[:, None]
+    return a + center, d
+
+
+def _orient(a, b, c):
+    return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+
+
+def _in_circle(a, b, c, d):
+    adx, ady = a[0] - d[0], a[1] - d[1]
+    bdx, bdy = b[0] - d[0], b[1] - d[1]
+    cdx, cdy = c[0] - d[0], c[1] - d[1]
+    return ((adx * adx + ady * ady) * (bdx * cdy - cdx * bdy)
+            + (bdx * bdx + bdy * bdy) * (cdx * ady - adx * cdy)
+            + (cdx * cdx + cdy * cdy) * (adx * bdy - bdx * ady))
+
+
+class KineticVoronoi:
+    """Voronoi cells of moving generators that reuse the last triangulation.
+
+    The Delaunay triangulation of the generators (plus four fixed guard
+    points far outside the boundary, which keep every cell bounded) is
+    built with Qhull once and then kept. Each frame it is checked against
+    the new positions: every triangle must still be counter-clockwise and
+    every interior edge must still pass the incircle test. If so, the
+    triangulation is still Delaunay, the Voronoi vertices are just the new
+    circumcenters and the cells keep their vertex order, so only the
+    clipping runs. Edges that fail the incircle test are flipped in place.
+
+    Generators are named by non-negative integer ids (fleet indices). When
+    one joins the set it replaces the triangles whose circumcircles contain
+    it (Bowyer-Watson); when one leaves, its star-shaped hole is refilled
+    ear by ear with empty-circle ears. A generator that moved across an
+    edge of its neighbours is taken out at its old position and put back
+    at the new one the same way. Only the triangles around the changed
+    generators are touched; Qhull only runs again when more than max_edits
+    generators change at once or an edit fails.
+
+    rebuilds and updates count the frames with and without Qhull, flips,
+    inserts and deletes the local edits.
+    """
+    def __init__(self, boundary, profiler=None, max_edits=32):
+        self.boundary = np.asarray(boundary, dtype=float)
+        self.profiler = NULL_PROFILER if profiler is None else profiler
+        self.max_edits = max_edits
+        self.center = (self.boundary.min(axis=0) + self.boundary.max(axis=0)) / 2
+        far = 4 * np.ptp(self.boundary, axis=0).max()
+        self.xy = np.zeros((GUARDS + 16, 2))
+        self.xy[:GUARDS] = far * np.array([(-1, -1), (1, -1), (1, 1), (-1, 1)], dtype=float)
+        self.rebuilds = 0
+        self.updates = 0
+        self.flips = 0
+        self.inserts = 0
+        self.deletes = 0
+        self.topology_changed = False
+        self.complete = False
+        self._ids = None
+
+    def _rebuild(self, ids):
+        slots = np.concatenate([np.arange(GUARDS), ids + GUARDS])
+        tri = Delaunay(self.xy[slots])
+        # Coincident points are left out; they must get a cell once they separate
+        self.complete = len(tri.coplanar) == 0
+        simplices = slots[tri.simplices]
+        a, b, c = (self.xy[simplices[:, k]] for k in range(3))
+        clockwise = _cross(b - a, c - a) < 0
+        simplices[clockwise, 1:] = simplices[clockwise, :0:-1]
+        self.simplices = simplices
+        self.rebuilds += 1
+
+    def _edges(self):
+        """Index the interior edges of the current triangles.
+
+        Every interior edge is kept once as the flat positions t * 3 + k of
+        the vertices facing it in its two triangles.
+        """
+        simplices = self.simplices
+        # Edge opposite vertex k of triangle t, keyed by its two end slots
+        u, v = simplices[:, [1, 2, 0]].ravel(), simplices[:, [2, 0, 1]].ravel()
+        key = np.minimum(u, v) * len(self.xy) + np.maximum(u, v)
+        order = np.argsort(key, kind='stable')
+        shared = np.flatnonzero(key[order][1:] == key[order][:-1])
+        self.edge_a = order[shared]
+        self.edge_b = order[shared + 1]
+
+    def _cell_order(self, ids):
+        """Cell of generator k: circumcenters of its triangles in angular order."""
+        simplices = self.simplices
+        rank = np.full(len(self.xy), -1)
+        rank[ids + GUARDS] = np.arange(len(ids))
+        owner = rank[simplices.ravel()]
+        triangle = np.repeat(np.arange(len(simplices)), 3)
+        corner = simplices.ravel()
+        keep = owner >= 0
+        owner, triangle, corner = owner[keep], triangle[keep], corner[keep]
+        gap = self.xy[simplices].mean(axis=1)[triangle] - self.xy[corner]
+        order = np.lexsort((np.arctan2(gap[:, 1], gap[:, 0]), owner))
+        self.indices = triangle[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(owner, minlength=len(ids)))])
+
+    def _repair(self, max_rounds=32):
+        """Restore the Delaunay property after the points moved, by edge flips.
+
+        Every interior edge that fails the incircle test is flipped (Lawson),
+        in rounds of edges that share no triangle, until none fails. Returns
+        False if a triangle turned over or the flips do not settle.
+        """
+        simplices = self.simplices
+        a, b, c = (self.xy[simplices[:, k]] for k in range(3))
+        if (_cross(b - a, c - a) <= 0).any():
+            return False
+        for _ in range(max_rounds):
+            t = self.edge_a // 3
+            d = self.xy[simplices.ravel()[self.edge_b]]
+            illegal = np.flatnonzero(incircle(a[t], b[t], c[t], d) > 0)
+            if len(illegal) == 0:
+                return True
+            used = set()
+            chosen = []
+            for i, t, u in zip(illegal.tolist(), (self.edge_a[illegal] // 3).tolist(),
+                               (self.edge_b[illegal] // 3).tolist()):
+                if t not in used and u not in used:
+                    used.update((t, u))
+                    chosen.append(i)
+            # Triangles (p, e1, e2) and (d, e2, e1) become (p, e1, d) and (p, d, e2)
+            t, kt = np.divmod(self.edge_a[chosen], 3)
+            u, ku = np.divmod(self.edge_b[chosen], 3)
+            p, d = simplices[t, kt], simplices[u, ku]
+            e1, e2 = simplices[t, (kt + 1) % 3], simplices[t, (kt + 2) % 3]
+            simplices[t] = np.column_stack([p, e1, d])
+            simplices[u] = np.column_stack([p, d, e2])
+            self.flips += len(chosen)
+            self.topology_changed = True
+            self._edges()
+            a, b, c = (self.xy[simplices[:, k]] for k in range(3))
+        return False
+
+    def _insert(self, slot):
+        """Bowyer-Watson insertion of one vertex; False if it cannot be placed."""
+        xy, simplices = self.xy, self.simplices
+        a, b, c = (xy[simplices[:, k]] for k in range(3))
+        bad = incircle(a, b, c, xy[slot][None]) > 0
+        if not bad.any():
+            return False
+        cavity = simplices[bad]
+        start, end = cavity.ravel(), cavity[:, [1, 2, 0]].ravel()
+        n = len(xy)
+        outer = ~np.isin(start * n + end, end * n + start)
+        new = np.column_stack([np.full(outer.sum(), slot), start[outer], end[outer]])
+        a, b, c = (xy[new[:, k]] for k in range(3))
+        if (_cross(b - a, c - a) <= 0).any():
+            return False
+        self.simplices = np.concatenate([simplices[~bad], new])
+        self.topology_changed = True
+        self.inserts += 1
+        return True
+
+    def _delete(self, slot):
+        """Remove one vertex and refill its star; False if no valid ear is found."""
+        xy, simplices = self.xy, self.simplices
+        star = (simplices == slot).any(axis=1)
+        link = {}
+        for tri in simplices[star].tolist():
+            k = tri.index(slot)
+            link[tri[(k + 1) % 3]] = tri[(k + 2) % 3]
+        polygon = [next(iter(link))]
+        while len(polygon) < len(link):
+            polygon.append(link[polygon[-1]])
+        points = {s: xy[s].tolist() for s in polygon}
+
+        fill = []
+        while len(polygon) > 3:
+            m = len(polygon)
+            for i in range(m):
+                a, b, c = polygon[i - 1], polygon[i], polygon[(i + 1) % m]
+                pa, pb, pc = points[a], points[b], points[c]
+                if _orient(pa, pb, pc) <= 0:
+                    continue
+                if any(_in_circle(pa, pb, pc, points[d]) > 0 for d in polygon if d not in (a, b, c)):
+                    continue
+                fill.append((a, b, c))
+                del polygon[i]
+                break
+            else:
+                return False
+        fill.append(tuple(polygon))
+        self.simplices = np.concatenate([simplices[~star], np.array(fill, dtype=simplices.dtype)])
+        self.topology_changed = True
+        self.deletes += 1
+        return True
+
+    def _advance(self, target):
+        """Move the vertices to target, holding back those that would turn a triangle over.
+
+        Returns the held-back slots, which are still at their old position,
+        or None if no triangle of the old positions is left to keep.
+        """
+        xy = target.copy()
+        held = np.zeros(len(xy), dtype=bool)
+        simplices = self.simplices
+        while True:
+            a, b, c = (xy[simplices[:, k]] for k in range(3))
+            over = simplices[_cross(b - a, c - a) <= 0].ravel()
+            if len(over) == 0:
+                break
+            over = over[(over >= GUARDS) & ~held[over]]
+            if len(over) == 0:
+                return None
+            held[over] = True
+            xy[over] = self.xy[over]
+        self.xy = xy
+        return np.flatnonzero(held)
+
+    def _edit(self, delete, insert, target):
+        """Delete and (re)insert single vertices in place; False if any edit fails."""
+        for slot in delete.tolist():
+            if not self._delete(slot):
+                return False
+        self.xy[insert] = target[insert]
+        for slot in insert.tolist():
+            if not self._insert(slot):
+                return False
+        return True
+
+    def cells(self, points, ids=None):
+        """Clipped cells of the generators, in the order of ids.
+
+        ids are non-negative integers that name the generators across frames;
+        by default the points are numbered 0..n-1.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if len(points) == 0:
+            self._ids = None
+            return Cells.empty()
+        ids = np.arange(len(points)) if ids is None else np.asarray(ids, dtype=np.int64)
+        if GUARDS + ids.max() >= len(self.xy):
+            grown = np.zeros((2 * (GUARDS + ids.max() + 1), 2))
+            grown[:len(self.xy)] = self.xy
+            self.xy = grown
+        target = self.xy.copy()
+        target[ids + GUARDS] = points - self.center
+
+        self.topology_changed = False
+        kept = self._ids is not None and self.complete
+        if kept:
+            with self.profiler.span('check'):
+                if np.array_equal(ids, self._ids):
+                    removed = added = ids[:0]
+                else:
+                    removed = np.setdiff1d(self._ids, ids) + GUARDS
+                    added = np.setdiff1d(ids, self._ids) + GUARDS
+                # Cars that moved across a neighbour's edge are taken out and put back
+                held = self._advance(target)
+                kept = (held is not None and len(held) + len(removed) + len(added) <= self.max_edits
+                        and self._repair())
+        if kept and (len(held) or len(removed) or len(added)):
+            with self.profiler.span('edit'):
+                kept = self._edit(np.union1d(held, removed),
+                                  np.setdiff1d(np.union1d(held, added), removed), target)
+        if kept:
+            self.updates += 1
+            if self.topology_changed:
+                self._edges()
+            if self.topology_changed or not np.array_equal(ids, self._ids):
+                self._cell_order(ids)
+        else:
+            with self.profiler.span('rebuild'):
+                self.xy = target
+                self._rebuild(ids)
+                self._edges()
+                self._cell_order(ids)
+        self._ids = ids.copy()
+
+        a, b, c = (self.xy[self.simplices[:, k]] for k in range(3))
+        vertices, _ = circumcenters(a, b, c)
+        with self.profiler.span('clip'):
+            return clip_convex_cells(self.indices, self.offsets, vertices + self.center, self.boundary)
@@ -0,0 +1,93 @@
+import math
+import numpy as np
+
+
+class RunMetrics:
+    """Running counters for run_experiment, updated in O(1) per event.
+
+    Replaces replaying the delivery history and re-summing per-car counters
+    every frame. The per-frame values are bit-for-bit those of the original
+    computation, except task_std, which differs from np.std in rounding only.
+    """
+    def __init__(self, n_cars):
+        self.n_cars = n_cars
+        self.frames = 0
+        self.deliveries = 0
+        self.task_counts = np.zeros(n_cars, dtype=np.int64)
+        # Running mean and sum of squared deviations of task_counts
+        self._task_mean = 0.0
+        self._task_m2 = 0.0
+        self.idle_frames = 0
+        self.busy_frames = 0
+        self.lifecycle_total = 0
+        self.lifecycle_count = 0
+        # Cars heading for an item they have not picked up yet
+        self.overlap_total = 0
+        self._car_target = {}
+        self._item_cars = {}
+        self._overlap = 0
+
+    def _release(self, car):
+        serial = self._car_target.pop(car, None)
+        if serial is not None:
+            self._item_cars[serial] -= 1
+            if self._item_cars[serial] == 0:
+                del self._item_cars[serial]
+            else:
+                self._overlap -= 1
+
+    def assign(self, car, serial):
+        self._release(car)
+        self._car_target[car] = serial
+        if serial in self._item_cars:
+            self._overlap += 1
+        self._item_cars[serial] = self._item_cars.get(serial, 0) + 1
+
+    def pickup(self, car):
+        self._release(car)
+
+    def sample_overlap(self):
+        """Add the number of cars currently chasing an already-targeted item."""
+        self.overlap_total += self._overlap
+
+    def deliver(self, car, lifecycle=None):
+        count = int(self.task_counts[car])
+        self.task_counts[car] = count + 1
+        # Welford update for one count going from count to count + 1; the
+        # mean is taken from the exact delivery total so it does not drift
+        delta = count - self._task_mean
+        self.deliveries += 1
+        self._task_mean = self.deliveries / self.n_cars
+        self._task_m2 += delta + (count + 1 - self._task_mean)
+        if lifecycle is not None:
+            self.lifecycle_total += lifecycle
+            self.lifecycle_count += 1
+
+    def end_frame(self, idle_count, busy_count):
+        self.frames += 1
+        self.idle_frames += idle_count
+        self.busy_frames += busy_count
+
+    @property
+    def task_std(self):
+        """Population standard deviation of per-car delivery counts, in O(1)."""
+        if self.n_cars < 2:
+            return 0.0
+        return math.sqrt(max(self._task_m2, 0.0) / self.n_cars)
+
+    def idle_ratio(self, car_frames=None):
+        if car_frames is None:
+            car_frames = self.frames * self.n_cars
+        return self.idle_frames / car_frames if car_frames > 0 else 0
+
+    def box_efficiency(self, created):
+        return (self.deliveries / created) * 100 if created > 0 else 0
+
+    def avg_lifecycle(self, fps):
+        """Average frames from appearance to delivery, divided by fps."""
+        if self.lifecycle_count == 0:
+            return 0.0
+        return self.lifecycle_total / self.lifecycle_count / fps
+
+    def avg_busy(self):
+        return self.busy_frames / self.frames if self.frames > 0 else 0
@@ -0,0 +1,87 @@
+import numpy as np
+from scipy.spatial import ConvexHull, QhullError
+from fleet import ASSIGNED
+from utils import clip_convex_cells
+
+
+def power_vertices(points, weights):
+    """Power diagram of weighted points via the lower hull of their lifting.
+
+    Every point p with weight w is lifted to (x, y, |p|^2 - w); each lower
+    facet of the 3-D convex hull is a triangle of the regular triangulation
+    and its plane z = 2 v.p + c gives the power vertex v. Qhull builds the
+    hull in O(N log N).
+
+    Returns (vertices, indices, offsets) in the CSR layout of
+    voronoi_finite_polygons_2d: the cell of point k is
+    vertices[indices[offsets[k]:offsets[k + 1]]], counter-clockwise. Points
+    whose lifting is not on the lower hull have empty cells.
+    """
+    n = len(points)
+    lifted = np.column_stack([points, np.einsum('ij,ij->i', points, points) - weights])
+    try:
+        hull = ConvexHull(lifted)
+    except QhullError:
+        hull = ConvexHull(lifted, qhull_options='QJ')
+    lower = hull.equations[:, 2] < 0
+    normals = hull.equations[lower]
+    vertices = -normals[:, :2] / (2 * normals[:, 2:3])
+
+    # (point, vertex) incidences of the lower facets
+    owner = hull.simplices[lower].ravel()
+    vertex = np.repeat(np.arange(len(vertices)), 3)
+    owner, vertex = owner[owner < n], vertex[owner < n]
+
+    counts = np.bincount(owner, minlength=n)
+    cx = np.bincount(owner, vertices[vertex, 0], n) / np.maximum(counts, 1)
+    cy = np.bincount(owner, vertices[vertex, 1], n) / np.maximum(counts, 1)
+    angles = np.arctan2(vertices[vertex, 1] - cy[owner], vertices[vertex, 0] - cx[owner])
+    order = np.lexsort((angles, owner))
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    return vertices, vertex[order], offsets
+
+
+def power_cells(points, weights, boundary):
+    """Clipped power cells, areas and centroids of weighted generators.
+
+    The power distance from q to generator k is |q - p_k|^2 - w_k; with all
+    weights equal this is the ordinary Voronoi diagram. Four far-away
+    guard generators keep every cell bounded without reaching into the
+    boundary, so no infinite regions have to be closed. Returns a
+    utils.Cells in generator order, a drop-in for Voronoi +
+    voronoi_finite_polygons_2d + clip_convex_cells.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    weights = np.broadcast_to(np.asarray(weights, dtype=float), len(points))
+    boundary = np.asarray(boundary, dtype=float)
+    if len(points) == 0:
+        return clip_convex_cells(np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64),
+                                 np.zeros((0, 2)), boundary)
+
+    # Work around the box center to keep the lifted coordinates well scaled
+    extent = np.concatenate([boundary, points])
+    center = (extent.min(axis=0) + extent.max(axis=0)) / 2
+    span = np.ptp(extent, axis=0).max()
+    far = 4 * span + np.sqrt(max(0.0, -weights.max()))
+    guards = far * np.array([(-1, -1), (1, -1), (1, 1), (-1, 1)], dtype=float)
+    shifted = np.concatenate([points - center, guards])
+    lifted_weights = np.concatenate([weights, np.zeros(4)])
+
+    vertices, indices, offsets = power_vertices(shifted, lifted_weights)
+    offsets = offsets[:len(points) + 1]
+    return clip_convex_cells(indices[:offsets[-1]], offsets, vertices + center, boundary)
+
+
+def fleet_weights(fleet, assigned=None, speed_horizon=0.0):
+    """Power weights of every car from its task state and speed.
+
+    Free cars get (speed * speed_horizon)^2, so a car that covers more
+    ground in speed_horizon seconds claims a larger cell. Cars with an
+    assigned task get the weight `assigned`: a negative value shrinks their
+    cell to a small region around them, and None (or -inf) drops them from
+    the diagram, which is what the unweighted simulation does.
+    """
+    weights = (fleet.speed * speed_horizon) ** 2
+    busy = fleet.has(ASSIGNED)
+    weights[busy] = -np.inf if assigned is None else assigned
+    return weights
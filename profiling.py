@@ -0,0 +1,182 @@
+import json
+import time
+import pygame
+import numpy as np
+
+# Histogram buckets: SUB_BUCKETS per power of two of the duration in ns
+SUB_BUCKETS = 4
+N_BUCKETS = 64 * SUB_BUCKETS
+
+
+def _bucket(ns):
+    bits = ns.bit_length()
+    if bits <= 2:
+        return ns
+    return (bits - 2) * SUB_BUCKETS + ((ns >> (bits - 3)) & (SUB_BUCKETS - 1))
+
+
+def bucket_edges():
+    """Lower edge in ns of every histogram bucket."""
+    edges = np.zeros(N_BUCKETS, dtype=np.float64)
+    for b in range(N_BUCKETS):
+        if b < SUB_BUCKETS:
+            edges[b] = b
+        else:
+            octave, sub = divmod(b, SUB_BUCKETS)
+            edges[b] = 2.0 ** (octave + 1) * (1 + sub / SUB_BUCKETS)
+    return edges
+
+
+class _Span:
+    """Timer of one named stage, used as a context manager."""
+    __slots__ = ('name', 'counts', 'count', 'total', 'max', 'last', 'recent', '_start')
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = [0] * N_BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.last = 0
+        self.recent = 0.0
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.record(time.perf_counter_ns() - self._start)
+
+    def record(self, ns):
+        self.counts[_bucket(ns)] += 1
+        self.count += 1
+        self.total += ns
+        self.last = ns
+        if ns > self.max:
+            self.max = ns
+        # Smoothed recent duration for the overlay
+        self.recent += 0.05 * (ns - self.recent)
+
+    def percentile(self, q):
+        """Approximate q-th percentile in ns (lower bucket edge, within 1/SUB_BUCKETS of an octave)."""
+        if self.count == 0:
+            return 0.0
+        cumulative = np.cumsum(self.counts)
+        return float(bucket_edges()[np.searchsorted(cumulative, q / 100 * self.count)])
+
+    def summary(self):
+        ms = 1e-6
+        return {
+            'count': self.count,
+            'total_ms': self.total * ms,
+            'mean_ms': self.total / self.count * ms if self.count else 0.0,
+            'p50_ms': self.percentile(50) * ms,
+            'p90_ms': self.percentile(90) * ms,
+            'p99_ms': self.percentile(99) * ms,
+            'max_ms': self.max * ms,
+        }
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Profiler:
+    """Named timing spans around the stages of the frame loop.
+
+    `with profiler.span('voronoi'):` times a block with the monotonic
+    perf_counter_ns clock and adds it to a log-bucketed histogram (a
+    constant-time list increment, no per-sample storage). Spans may nest;
+    each records its own inclusive time.
+
+    A disabled profiler (or NULL_PROFILER) hands out one shared do-nothing
+    context manager, so instrumented code costs a method call per span.
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.spans = {}
+        self._laps = {}
+
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        span = self.spans.get(name)
+        if span is None:
+            span = self.spans[name] = _Span(name)
+        return span
+
+    def lap(self, name='frame'):
+        """Record the time since the previous lap(name), e.g. once per frame."""
+        if not self.enabled:
+            return
+        now = time.perf_counter_ns()
+        last = self._laps.get(name)
+        if last is not None:
+            self.span(name).record(now - last)
+        self._laps[name] = now
+
+    def summary(self):
+        return {name: span.summary() for name, span in self.spans.items()}
+
+    def dump(self, path):
+        """Write the summary and the raw histograms of every span as JSON."""
+        data = {
+            'bucket_edges_ns': bucket_edges().tolist(),
+            'spans': {name: dict(span.summary(), histogram=span.counts)
+                      for name, span in self.spans.items()},
+        }
+        with open(path, 'w') as f:
+            json.dump(data, f)
+
+    def report(self):
+        """Summary table as text, slowest spans first."""
+        lines = [f"{'span':<12}{'count':>8}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        for name, s in sorted(self.summary().items(), key=lambda kv: -kv[1]['total_ms']):
+            lines.append(f"{name:<12}{s['count']:>8}{s['mean_ms']:>10.3f}{s['p50_ms']:>10.3f}"
+                         f"{s['p99_ms']:>10.3f}{s['max_ms']:>10.3f}")
+        return '\n'.join(lines)
+
+
+NULL_PROFILER = Profiler(enabled=False)
+
+
+class Overlay:
+    """On-screen table of the smoothed duration of every span.
+
+    The text is re-rendered only every `every` frames and otherwise
+    blitted from a cached surface.
+    """
+    def __init__(self, profiler, every=15):
+        pygame.font.init()
+        self.profiler = profiler
+        self.every = every
+        self.font = pygame.font.SysFont('monospace', 12)
+        self._frames = 0
+        self._surface = None
+
+    def draw(self, screen):
+        """Draw the table in the top-left corner and return its rectangle."""
+        if self._surface is None or self._frames % self.every == 0:
+            rows = [f"{name:<10}{span.recent / 1e6:7.2f} ms" for name, span in self.profiler.spans.items()]
+            lines = [self.font.render(row, True, (0, 0, 0)) for row in rows]
+            height = sum(line.get_height() for line in lines) + 4
+            width = max([line.get_width() for line in lines] + [1]) + 8
+            surface = pygame.Surface((width, height))
+            surface.fill((240, 240, 240))
+            y = 2
+            for line in lines:
+                surface.blit(line, (4, y))
+                y += line.get_height()
+            self._surface = surface
+        self._frames += 1
+        return screen.blit(self._surface, (0, 0))
@@ -0,0 +1,98 @@
+import numpy as np
+from assignment import NearestAssigner
+from utils import uniform
+
+
+class DemandMap:
+    """Probability of an item appearing, as a raster over the workspace.
+
+    density is a 2-D array of non-negative weights; row i and column j
+    cover y in [i, i + 1) and x in [j, j + 1) times the raster cell size.
+    Zero marks places where items never appear, such as obstacles. Without
+    a density the demand is uniform.
+    """
+    def __init__(self, env_size, density=None):
+        density = np.ones((1, 1)) if density is None else np.asarray(density, dtype=float)
+        if density.ndim != 2 or (density < 0).any() or not density.sum() > 0:
+            raise ValueError("density must be a 2-D array of non-negative weights with a positive sum")
+        self.env_size = env_size
+        self.density = density
+        self.cell = env_size / np.array(density.shape[::-1], dtype=float)
+        self._cumulative = np.cumsum(density.ravel())
+
+    @classmethod
+    def load(cls, path, env_size):
+        """Demand map from a 2-D array saved with np.save."""
+        return cls(env_size, np.load(path))
+
+    def at(self, points):
+        """Density at every point."""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        rows, cols = self.density.shape
+        col = np.clip((points[:, 0] // self.cell[0]).astype(int), 0, cols - 1)
+        row = np.clip((points[:, 1] // self.cell[1]).astype(int), 0, rows - 1)
+        return self.density[row, col]
+
+    def sample(self, rng=None):
+        """Random position drawn from the demand, with rng as in utils.uniform."""
+        k = int(np.searchsorted(self._cumulative, uniform(rng, 0, self._cumulative[-1]), side='right'))
+        row, col = divmod(min(k, len(self._cumulative) - 1), self.density.shape[1])
+        return (col + uniform(rng, 0, 1)) * self.cell[0], (row + uniform(rng, 0, 1)) * self.cell[1]
+
+
+class RasterCells:
+    """Regions of a RasterPartition with the parts of the utils.Cells interface the frame loop uses.
+
+    areas is the demand-weighted area of every region and centroids its
+    demand-weighted centroid; regions without demand are not valid. The
+    regions have no polygons, so points and offsets are empty and nothing
+    is drawn for them.
+    """
+    def __init__(self, labels, areas, centroids):
+        self.labels = labels
+        self.areas = areas
+        self.centroids = centroids
+        self.valid = areas > 0
+        self.points = np.zeros((0, 2))
+        self.offsets = np.zeros(len(areas) + 1, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.areas)
+
+    def vertices(self, k):
+        return self.points
+
+
+class RasterPartition:
+    """Partition of the workspace on a grid, weighted by item demand.
+
+    Every grid cell center is labelled with its nearest generator in one
+    KD-tree query (assignment.NearestAssigner; with weights the smallest
+    power distance, as in power.py). The demand-weighted area and centroid
+    of every region then take one np.bincount pass each over the labels.
+    The cost is O(G log N) for G grid cells and N generators, whatever the
+    shape of the regions, and the centroids follow a non-uniform demand.
+    resolution is the side of a grid cell.
+    """
+    def __init__(self, env_size, resolution=10.0, demand=None):
+        side = max(1, int(round(env_size / resolution)))
+        size = env_size / side
+        self.cell_area = size * size
+        x = (np.arange(side) + 0.5) * size
+        gx, gy = np.meshgrid(x, x)
+        self.centers = np.column_stack([gx.ravel(), gy.ravel()])
+        self.density = np.ones(len(self.centers)) if demand is None else demand.at(self.centers)
+        self._moment = self.centers * self.density[:, None]
+
+    def cells(self, points, weights=None):
+        """Regions of the generators, in order."""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        n = len(points)
+        labels = NearestAssigner(points, weights=weights).query(self.centers)
+        if n == 0:
+            return RasterCells(labels, np.zeros(0), np.zeros((0, 2)))
+        mass = np.bincount(labels, self.density, n)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            centroids = np.column_stack([np.bincount(labels, self._moment[:, 0], n),
+                                         np.bincount(labels, self._moment[:, 1], n)]) / mass[:, None]
+        return RasterCells(labels, mass * self.cell_area, centroids)
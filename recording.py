@@ -0,0 +1,168 @@
+import json
+import os
+import numpy as np
+
+META_FILE = 'meta.json'
+
+# Per frame: end offsets of the item, cell and cell-vertex streams
+INDEX_DTYPE = np.dtype([
+    ('items', np.int64),
+    ('cells', np.int64),
+    ('points', np.int64),
+])
+
+
+class TrajectoryRecorder:
+    """Append-only recording of everything a frame needs to be redrawn.
+
+    Fixed-size per-frame data (drone positions, car positions, car state bits)
+    goes to one raw file each. Variable-size data (live item positions and
+    the clipped cell polygons) goes to flat streams, with INDEX_DTYPE rows
+    marking where each frame ends, the same CSR layout utils.Cells uses.
+    Coordinates are stored as float32. Files are written through buffered
+    handles and can be opened with Recording while the run is going.
+    """
+    def __init__(self, path, n_cars, env_size, attrs=None, n_drones=1, sensor_range=100):
+        self.path = path
+        self.n_cars = n_cars
+        self.n_drones = n_drones
+        self.frames = 0
+        self._end = np.zeros(1, dtype=INDEX_DTYPE)
+        os.makedirs(path, exist_ok=True)
+        meta = {'n_cars': n_cars, 'n_drones': n_drones, 'sensor_range': sensor_range,
+                'env_size': env_size, 'attrs': attrs or {}}
+        with open(os.path.join(path, META_FILE), 'w') as f:
+            json.dump(meta, f, indent=2)
+        self._files = {name: open(os.path.join(path, name + '.bin'), 'wb')
+                       for name in Recording.STREAMS}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, drone, cars, state, items, cells):
+        """Record one frame.
+
+        drone is an (x, y) pair or an (n_drones, 2) array, cars an
+        (n_cars, 2) array with state the matching fleet bitmask, items an
+        (k, 2) array of items still on the ground and cells a utils.Cells
+        (only valid cells are stored).
+        """
+        f = self._files
+        np.asarray(drone, dtype=np.float32).tofile(f['drone'])
+        np.asarray(cars, dtype=np.float32).tofile(f['cars'])
+        np.asarray(state, dtype=np.uint8).tofile(f['state'])
+        items = np.asarray(items, dtype=np.float32).reshape(-1, 2)
+        items.tofile(f['items'])
+
+        valid = np.flatnonzero(cells.valid)
+        sizes = (cells.offsets[valid + 1] - cells.offsets[valid]).astype(np.int32)
+        sizes.tofile(f['cell_sizes'])
+        if len(valid) == len(cells):
+            points = cells.points
+        else:
+            points = np.concatenate([cells.vertices(k) for k in valid]) if len(valid) else np.zeros((0, 2))
+        points.astype(np.float32).tofile(f['cell_points'])
+
+        self._end['items'] += len(items)
+        self._end['cells'] += len(sizes)
+        self._end['points'] += len(points)
+        # Streams are buffered separately, so the index may reach the disk
+        # before the data it points to; Recording.refresh() allows for that
+        self._end.tofile(f['index'])
+        self.frames += 1
+
+    def flush(self):
+        for f in self._files.values():
+            f.flush()
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+
+class Frame:
+    """One recorded frame, as views into the recording's memory maps."""
+    def __init__(self, number, drone, cars, state, items, cell_sizes, cell_points):
+        self.number = number
+        self.drone = drone
+        self.cars = cars
+        self.state = state
+        self.items = items
+        self.cell_offsets = np.concatenate([[0], np.cumsum(cell_sizes, dtype=np.int64)])
+        self.cell_points = cell_points
+
+    def cells(self):
+        """Vertex arrays of the frame's cells."""
+        return [self.cell_points[a:b] for a, b in zip(self.cell_offsets[:-1], self.cell_offsets[1:])]
+
+
+class Recording:
+    """Random-access reader for a TrajectoryRecorder directory.
+
+    Every stream is memory-mapped, so seeking to any frame costs two index
+    lookups and a few slices. The frame count is taken from the file sizes,
+    counting only frames whose data is complete in every stream, so a
+    recording that is still being written can be reopened with refresh()
+    to see new frames.
+    """
+    STREAMS = {
+        'index': (INDEX_DTYPE, ()),
+        'drone': (np.float32, None),
+        'cars': (np.float32, None),
+        'state': (np.uint8, None),
+        'items': (np.float32, (2,)),
+        'cell_sizes': (np.int32, ()),
+        'cell_points': (np.float32, (2,)),
+    }
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        self.n_cars = meta['n_cars']
+        self.n_drones = meta.get('n_drones', 1)
+        self.sensor_range = meta.get('sensor_range', 100)
+        self.env_size = meta['env_size']
+        self.attrs = meta['attrs']
+        self.refresh()
+
+    def _map(self, name):
+        dtype, shape = self.STREAMS[name]
+        if name == 'drone':
+            shape = (2,) if self.n_drones == 1 else (self.n_drones, 2)
+        elif shape is None:
+            shape = (self.n_cars, 2) if name == 'cars' else (self.n_cars,)
+        dtype = np.dtype(dtype)
+        path = os.path.join(self.path, name + '.bin')
+        rows = os.path.getsize(path) // (dtype.itemsize * int(np.prod(shape, dtype=np.int64)))
+        if rows == 0:
+            return np.zeros((0,) + shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=(rows,) + shape)
+
+    def refresh(self):
+        """Re-map the files to pick up frames written since the last call."""
+        s = self._streams = {name: self._map(name) for name in self.STREAMS}
+        frames = min(len(s[name]) for name in ('index', 'drone', 'cars', 'state'))
+        # Only frames whose items and cells are fully on disk; the offsets never decrease
+        index = s['index'][:frames]
+        for column, name in (('items', 'items'), ('cells', 'cell_sizes'), ('points', 'cell_points')):
+            frames = min(frames, int(np.searchsorted(index[column], len(s[name]), side='right')))
+        self.frames = frames
+
+    def __len__(self):
+        return self.frames
+
+    def frame(self, i):
+        if not 0 <= i < self.frames:
+            raise IndexError(f"frame {i} out of range for a recording of {self.frames} frames")
+        s = self._streams
+        end = s['index'][i]
+        start = s['index'][i - 1] if i > 0 else np.zeros((), dtype=INDEX_DTYPE)
+        return Frame(i, s['drone'][i], s['cars'][i], s['state'][i],
+                     s['items'][start['items']:end['items']],
+                     s['cell_sizes'][start['cells']:end['cells']],
+                     s['cell_points'][start['points']:end['points']])
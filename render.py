@@ -0,0 +1,198 @@
+import pygame
+import numpy as np
+from fleet import HAS_ITEM, ASSIGNED
+from utils import draw_quarter_circle
+
+BACKGROUND = (255, 255, 255)
+DEPOT_COLOR = (255, 182, 193)
+CELL_COLOR = (0, 255, 0)
+SENSOR_COLOR = (173, 216, 230)
+CAR_COLOR = (255, 0, 0)
+CAR_SIZE = 10
+ITEM_COLOR = (255, 165, 0)
+ITEM_SIZE = 8
+DRONE_COLOR = (0, 0, 255)
+DRONE_SIZE = 10
+
+
+def _sprite(size):
+    surface = pygame.Surface((size, size), pygame.SRCALPHA)
+    surface.fill((0, 0, 0, 0))
+    return surface
+
+
+class Renderer:
+    """Layered renderer for the simulation window and off-screen surfaces.
+
+    The background and the depot are drawn once into a cached layer; the
+    drone with its sensor ring (one sprite per sensor range) and the items
+    are pre-rendered sprites that are only blitted. Cell edges are drawn
+    with pygame.draw.lines straight from the CSR vertex array into a cached
+    layer on top of the background, and cars are blitted from the fleet
+    arrays in a single Surface.blits call.
+
+    draw() returns the rectangles that changed since the previous frame,
+    for pygame.display.update(); when they cover most of the screen a
+    single full-screen rectangle is returned instead. The cells tile the
+    whole screen, so only the bounding boxes of the outlines that moved by
+    a pixel count as changed; when most cells move, the frame is a full
+    update. Only the outlines that cross a changed box are redrawn into the
+    cell layer.
+    """
+    def __init__(self, env_size, full_redraw_ratio=0.5):
+        self.env_size = env_size
+        self.full_redraw_area = full_redraw_ratio * env_size * env_size
+        self.background = pygame.Surface((env_size, env_size))
+        self.background.fill(BACKGROUND)
+        draw_quarter_circle(self.background, (env_size, env_size), 40, DEPOT_COLOR, env_size)
+
+        self.layer = self.background.copy()
+        self._drone_sprites = {}
+        self.item_sprite = _sprite(2 * ITEM_SIZE + 1)
+        pygame.draw.circle(self.item_sprite, ITEM_COLOR, (ITEM_SIZE, ITEM_SIZE), ITEM_SIZE)
+        self._car_sprites = None
+        self._cells = None
+        self._dirty = None
+        self._full = None
+
+    def _drone(self, sensor_range):
+        """Drone sprite with its sensor ring, centred in a (2r + 1)-square."""
+        r = int(sensor_range)
+        if r not in self._drone_sprites:
+            sprite = _sprite(2 * r + 1)
+            s = DRONE_SIZE
+            pygame.draw.polygon(sprite, DRONE_COLOR, [(r, r - s), (r - s, r + s), (r + s, r + s)])
+            pygame.draw.circle(sprite, SENSOR_COLOR, (r, r), r, 1)
+            self._drone_sprites[r] = sprite
+        return self._drone_sprites[r]
+
+    def _draw_cells(self, cell_points, cell_offsets, cell_valid):
+        """Bring the cell layer up to date and return the rectangles where it changed.
+
+        Outlines are compared in pixels with the previous frame's, and the
+        bounding boxes of all outlines come from one reduceat pass; the old
+        and new boxes of every outline that moved count as changed. Returns
+        None when the change covers more than full_redraw_area, or the cells
+        cannot be matched with the previous frame's.
+        """
+        offsets = np.asarray(cell_offsets)
+        sizes = np.diff(offsets)
+        # Raster regions have no outline
+        keep = sizes >= 2
+        if cell_valid is not None:
+            keep &= np.asarray(cell_valid, dtype=bool)
+        coords = np.asarray(cell_points)[:offsets[-1]].astype(int)
+        if not keep.all():
+            coords = coords[np.repeat(keep, sizes)]
+            sizes = sizes[keep]
+            offsets = np.concatenate([[0], np.cumsum(sizes)])
+        starts = offsets[:-1]
+        if len(starts):
+            lo = np.minimum.reduceat(coords, starts, axis=0)
+            hi = np.maximum.reduceat(coords, starts, axis=0)
+        else:
+            lo = hi = np.zeros((0, 2), dtype=int)
+
+        previous, self._cells = self._cells, (sizes, starts, coords, lo, hi)
+        changed = None
+        if previous is not None and len(sizes) == len(previous[0]):
+            # Cells keep their order; those with as many vertices as before are compared point by point
+            same = sizes == previous[0]
+            count = sizes[same]
+            first = np.cumsum(count) - count
+            within = np.arange(count.sum()) - np.repeat(first, count)
+            differs = (coords[np.repeat(starts[same], count) + within]
+                       != previous[2][np.repeat(previous[1][same], count) + within]).any(axis=1)
+            moved = ~same
+            if len(count):
+                moved[same] = np.logical_or.reduceat(differs, first)
+            if not moved.any():
+                return []
+            boxes_lo = np.concatenate([lo[moved], previous[3][moved]])
+            boxes_hi = np.concatenate([hi[moved], previous[4][moved]])
+            extent = boxes_hi - boxes_lo + 1
+            if (extent[:, 0] * extent[:, 1]).sum() <= self.full_redraw_area:
+                changed = [pygame.Rect(x, y, w, h)
+                           for (x, y), (w, h) in zip(boxes_lo.tolist(), extent.tolist())]
+
+        if changed is None:
+            self.layer.blit(self.background, (0, 0))
+            redraw = range(len(sizes))
+        else:
+            # Outlines crossing a changed box are redrawn whole: lines clipped
+            # to a rectangle are rasterized differently
+            for rect in changed:
+                self.layer.blit(self.background, rect, rect)
+            crosses = ((lo[:, None, :] <= boxes_hi[None]) & (hi[:, None, :] >= boxes_lo[None])).all(axis=2)
+            redraw = np.flatnonzero(crosses.any(axis=1)).tolist()
+        flat = coords.ravel().tolist()
+        points = list(zip(flat[0::2], flat[1::2]))
+        bounds = offsets.tolist()
+        for k in redraw:
+            pygame.draw.lines(self.layer, CELL_COLOR, True, points[bounds[k]:bounds[k + 1]])
+        return changed
+
+    def _cars(self, screen):
+        """Plain and loaded car sprites, in the pixel format of screen."""
+        if self._car_sprites is None:
+            self._car_sprites = []
+            for color in (CAR_COLOR, ITEM_COLOR):
+                sprite = pygame.Surface((2 * CAR_SIZE, 2 * CAR_SIZE), 0, screen)
+                sprite.fill(color)
+                self._car_sprites.append(sprite)
+        return self._car_sprites
+
+    def draw(self, screen, drone, cars, state, items, cell_points, cell_offsets, cell_valid=None, *,
+             sensor_range):
+        """Draw one frame from plain arrays and return the changed rectangles.
+
+        drone is an (x, y) pair or an (m, 2) array of drones with the given
+        sensor_range, cars an (n, 2) array with state the fleet bitmask,
+        items the (k, 2) positions of items on the ground and the cells are
+        given in CSR layout, optionally with a validity mask.
+        """
+        full = self._full = screen.get_rect()
+        moved = self._draw_cells(cell_points, cell_offsets, cell_valid)
+        previous = None if self._dirty is None or moved is None else self._dirty + moved
+        if previous is None or sum(r.w * r.h for r in previous) > self.full_redraw_area:
+            screen.blit(self.layer, (0, 0))
+            previous = [full]
+        else:
+            for rect in previous:
+                screen.blit(self.layer, rect, rect)
+
+        rects = []
+        sprite = self._drone(sensor_range)
+        corners = (np.asarray(drone, dtype=float).reshape(-1, 2).astype(int) - int(sensor_range)).tolist()
+        rects.extend(screen.blits([(sprite, corner) for corner in corners]))
+
+        # Cars are blitted in one batch; only the assignment rings are drawn
+        cars = np.asarray(cars)
+        state = np.asarray(state)
+        sprites = self._cars(screen)
+        loaded = ((state & HAS_ITEM) != 0).tolist()
+        corners = (cars - CAR_SIZE).astype(int).tolist()
+        rects.extend(screen.blits([(sprites[k], corner) for corner, k in zip(corners, loaded)]))
+        for i in np.flatnonzero(state & ASSIGNED):
+            color = ITEM_COLOR if loaded[i] else CAR_COLOR
+            rects.append(pygame.draw.circle(screen, color, cars[i].astype(int).tolist(), 50, 1))
+
+        items = np.asarray(items, dtype=int).reshape(-1, 2) - ITEM_SIZE
+        rects.extend(screen.blits([(self.item_sprite, corner) for corner in items.tolist()]))
+
+        self._dirty = rects
+        changed = previous + rects
+        if previous[0] is full or sum(r.w * r.h for r in changed) > self.full_redraw_area:
+            return [full]
+        return changed
+
+    def touch(self, rects, rect):
+        """Add a rectangle the caller drew over this frame to the changed ones."""
+        self._dirty.append(rect)
+        return rects if rects[0] == self._full else rects + [rect]
+
+    def draw_live(self, screen, drone, fleet, items, cells):
+        """Draw the live simulation: a Drone or DroneFleet, a Fleet, Item objects and Cells."""
+        on_ground = [(item.x, item.y) for item in items if not item.picked]
+        return self.draw(screen, np.column_stack([drone.x, drone.y]), fleet.pos, fleet.state, on_ground,
+                         cells.points, cells.offsets, cells.valid, sensor_range=drone.sensor_range)
@@ -0,0 +1,89 @@
+import os
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import pygame
+from recording import Recording
+from render import Renderer
+
+FPS = 60
+SPEEDS = [0.25, 0.5, 1, 2, 4, 8, 16]
+
+
+def replay(path, start=0, end=None, speed=1.0, paused=False):
+    """Play back frames [start, end) of a recording.
+
+    Frames are shown at the frame rate of the run, so x1 is real time.
+    Space pauses, left/right seek one second (one frame while paused),
+    up/down change the playback speed, Home/End jump to the ends of the
+    range and Escape quits. Nothing is recomputed; every frame is read
+    straight from the recording.
+    """
+    recording = Recording(path)
+    end = len(recording) if end is None else min(end, len(recording))
+    if not 0 <= start < end:
+        raise ValueError(f"empty frame range [{start}, {end}) for a recording of {len(recording)} frames")
+
+    pygame.init()
+    screen = pygame.display.set_mode((recording.env_size, recording.env_size))
+    clock = pygame.time.Clock()
+    renderer = Renderer(recording.env_size)
+    speed_idx = min(range(len(SPEEDS)), key=lambda k: abs(SPEEDS[k] - speed))
+    # Frames per simulated second of the recorded run
+    fps = recording.attrs.get('fps', FPS)
+    position = float(start)
+
+    running = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    running = False
+                elif event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+                    step = 1 if paused else round(fps)
+                    position += step if event.key == pygame.K_RIGHT else -step
+                elif event.key == pygame.K_UP:
+                    speed_idx = min(speed_idx + 1, len(SPEEDS) - 1)
+                elif event.key == pygame.K_DOWN:
+                    speed_idx = max(speed_idx - 1, 0)
+                elif event.key == pygame.K_HOME:
+                    position = start
+                elif event.key == pygame.K_END:
+                    position = end - 1
+
+        position = min(max(position, start), end - 1)
+        frame = recording.frame(int(position))
+        rects = renderer.draw(screen, frame.drone, frame.cars, frame.state, frame.items,
+                              frame.cell_points, frame.cell_offsets, sensor_range=recording.sensor_range)
+        state = 'paused' if paused else f"x{SPEEDS[speed_idx]:g}"
+        pygame.display.set_caption(f"Replay {os.path.basename(os.path.normpath(path))} - "
+                                   f"frame {frame.number + 1}/{len(recording)} ({state})")
+        pygame.display.update(rects)
+        clock.tick(fps)
+
+        if not paused:
+            position += SPEEDS[speed_idx]
+            if position >= end:
+                position = end - 1
+                paused = True
+
+    pygame.quit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded run without recomputing it.")
+    parser.add_argument('path', help='recording directory written by runExpts.py --record-dir')
+    parser.add_argument('--start', type=int, default=0, help='first frame to show')
+    parser.add_argument('--end', type=int, default=None, help='stop before this frame')
+    parser.add_argument('--speed', type=float, default=1.0, help='initial playback speed')
+    parser.add_argument('--paused', action='store_true', help='start paused')
+    args = parser.parse_args()
+    replay(args.path, args.start, args.end, args.speed, args.paused)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,99 @@
 
+import bisect
 import math
 import pygame
-import random
 import numpy as np
+from scipy.spatial import cKDTree
+from fleet import Fleet, HAS_ITEM, DELIVERING, ASSIGNED, JUST_DELIVERED
+from utils import uniform, box_boundary
+from power import power_cells
+from events import ASSIGN
+
+class ArcPath:
+    """Closed flight paths parametrized by arc length.
+
+    Each path is flown once from its start to its first waypoint and then
+    round its waypoints, back from the last to the first, for ever. The
+    segments of all paths are kept in flat arrays with their cumulative arc
+    length, every path offset past the previous one, so position() looks up
+    any mix of paths and distances with one np.searchsorted.
+    """
+    def __init__(self, paths, starts=None):
+        origins, directions, lengths, first, lead, period = [], [], [], [], [], []
+        for p, path in enumerate(paths):
+            path = np.asarray(path, dtype=float).reshape(-1, 2)
+            start = path[0] if starts is None else np.asarray(starts[p], dtype=float)
+            vertices = np.vstack([start, path, path[:1]])
+            delta = np.diff(vertices, axis=0)
+            length = np.hypot(delta[:, 0], delta[:, 1])
+            first.append(sum(len(l) for l in lengths))
+            origins.append(vertices[:-1])
+            directions.append(np.divide(delta, length[:, None], out=np.zeros_like(delta),
+                                        where=length[:, None] > 0))
+            lengths.append(length)
+            lead.append(length[0])
+            period.append(length[1:].sum())
+        self.origin = np.concatenate(origins)
+        self.direction = np.concatenate(directions)
+        self.length = np.concatenate(lengths)
+        self.first = np.array(first)
+        self.last = np.append(self.first[1:], len(self.length)) - 1
+        self.loop_start = np.array(lead)
+        self.period = np.array(period)
+        # Arc length of every segment start within its path, and over all paths
+        self.start = np.concatenate([np.concatenate([[0.0], np.cumsum(l)[:-1]]) for l in lengths])
+        self.base = np.concatenate([[0.0], np.cumsum(self.loop_start + self.period)[:-1]])
+        self.offset = self.start + np.repeat(self.base, self.last - self.first + 1)
+        # Plain lists for point(), which one drone calls every step
+        self._lists = [a.tolist() for a in (self.offset, self.start, self.length, self.origin,
+                                            self.direction, self.base, self.loop_start, self.period,
+                                            self.first, self.last)]
+
+    def __len__(self):
+        return len(self.first)
+
+    def position(self, distance, path=0):
+        """Point at the given arc length along a path; both broadcast."""
+        distance, path = np.broadcast_arrays(np.asarray(distance, dtype=float), np.asarray(path))
+        lead = self.loop_start[path]
+        period = self.period[path]
+        distance = np.maximum(distance, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            wrapped = lead + np.mod(distance - lead, period)
+        s = np.where((distance > lead) & (period > 0), wrapped, np.minimum(distance, lead + period))
+        seg = np.searchsorted(self.offset, self.base[path] + s, side='right') - 1
+        seg = np.clip(seg, self.first[path], self.last[path])
+        t = np.clip(s - self.start[seg], 0.0, self.length[seg])
+        return self.origin[seg] + t[..., None] * self.direction[seg]
+
+    def point(self, distance, path=0):
+        """position() of a single distance, as an (x, y) tuple without NumPy overhead."""
+        offset, start, length, origin, direction, base, lead, period, first, last = self._lists
+        lead, period = lead[path], period[path]
+        distance = max(distance, 0.0)
+        if distance > lead and period > 0:
+            s = lead + (distance - lead) % period
+        else:
+            s = min(distance, lead + period)
+        seg = bisect.bisect_right(offset, base[path] + s) - 1
+        seg = min(max(seg, first[path]), last[path])
+        t = min(max(s - start[seg], 0.0), length[seg])
+        (ox, oy), (dx, dy) = origin[seg], direction[seg]
+        return ox + t * dx, oy + t * dy
+
 
 class Drone:
-    def __init__(self, x, y, env_size):
+    def __init__(self, x, y, env_size, dt=1 / 60):
         self.x = x
         self.y = y
         self.size = 10
         self.color = (0, 0, 255)
         self.env_size = env_size
         self.path = self.generate_zigzag_path()
-        self.path_index = 0
-        self.speed = 6
+        self.arc = ArcPath([self.path], [(x, y)])
+        self.ticks = 0
+        self.speed = 360  # units per second
+        self.dt = dt
         self.sensor_range = 100
 
     def generate_zigzag_path(self):
@@ -35,22 +115,21 @@ class Drone:
 
         return path
 
+    @property
+    def step_length(self):
+        """Distance flown in one update of dt seconds."""
+        return self.speed * self.dt
+
+    def position_at(self, ticks):
+        """Position after the given number of updates; ticks may be an array."""
+        if np.ndim(ticks) == 0:
+            return self.arc.point(ticks * self.step_length)
+        return self.arc.position(np.asarray(ticks) * self.step_length)
+
     def update(self):
-        """Update drone position."""
-        if self.path_index < len(self.path):
-            target_x, target_y = self.path[self.path_index]
-            dx = target_x - self.x
-            dy = target_y - self.y
-            distance = math.hypot(dx, dy)
-            if distance > self.speed:
-                self.x += (dx / distance) * self.speed
-                self.y += (dy / distance) * self.speed
-            else:
-                self.x = target_x
-                self.y = target_y
-                self.path_index += 1
-        else:
-            self.path_index = 0
+        """Advance the drone by one step of dt seconds."""
+        self.ticks += 1
+        self.x, self.y = self.position_at(self.ticks)
 
     def draw(self, screen):
         """Draw the drone."""
@@ -60,136 +139,208 @@ class Drone:
         pygame.draw.polygon(screen, self.color, [point1, point2, point3])
         pygame.draw.circle(screen, (173, 216, 230), (int(self.x), int(self.y)), int(self.sensor_range), 1)
 
+DRONE_LAYOUTS = ('strips', 'voronoi')
+
+
+def _vertical_extent(polygon, x):
+    """Lowest and highest y of a convex polygon along the vertical line at x."""
+    p, q = polygon, np.roll(polygon, -1, axis=0)
+    lo, hi = np.minimum(p[:, 0], q[:, 0]), np.maximum(p[:, 0], q[:, 0])
+    crossing = (lo <= x) & (x <= hi) & (hi > lo)
+    p, q = p[crossing], q[crossing]
+    y = p[:, 1] + (x - p[:, 0]) * (q[:, 1] - p[:, 1]) / (q[:, 0] - p[:, 0])
+    return y.min(), y.max()
+
+
+def sweep_path(polygon, lane):
+    """Boustrophedon waypoints covering a convex polygon.
+
+    Vertical lanes at most `lane` apart run across the polygon, alternately
+    upwards and downwards. Each lane spans the polygon over its whole strip,
+    inset by half the spacing from its ends, so every point of the polygon
+    lies within lane / sqrt(2) of the path.
+    """
+    polygon = np.asarray(polygon, dtype=float)
+    x_min, x_max = polygon[:, 0].min(), polygon[:, 0].max()
+    n_lanes = max(1, math.ceil((x_max - x_min) / lane))
+    spacing = (x_max - x_min) / n_lanes
+    path = []
+    for i in range(n_lanes):
+        x = x_min + (i + 0.5) * spacing
+        # The polygon's extent over the strip [x - spacing/2, x + spacing/2]
+        a, b = max(x - spacing / 2, x_min), min(x + spacing / 2, x_max)
+        inner = polygon[(polygon[:, 0] >= a) & (polygon[:, 0] <= b), 1]
+        edges = np.array([_vertical_extent(polygon, a), _vertical_extent(polygon, b)])
+        y_lo = min(edges[:, 0].min(), inner.min(initial=np.inf))
+        y_hi = max(edges[:, 1].max(), inner.max(initial=-np.inf))
+        inset = min(spacing / 2, (y_hi - y_lo) / 2)
+        ends = [(x, y_lo + inset), (x, y_hi - inset)]
+        path.extend(ends[::-1] if i % 2 else ends)
+    return path
+
+
+def drone_regions(env_size, n, layout='strips', iterations=20):
+    """Convex regions of the workspace, one per drone.
+
+    'strips' cuts it into n vertical strips of equal width; 'voronoi' uses
+    the Voronoi cells of n generators spread by Lloyd relaxation, which
+    keeps the regions compact when n is large.
+    """
+    if layout == 'strips':
+        edges = np.linspace(0, env_size, n + 1)
+        return [np.array([(a, 0), (b, 0), (b, env_size), (a, env_size)], dtype=float)
+                for a, b in zip(edges[:-1], edges[1:])]
+    if layout != 'voronoi':
+        raise ValueError(f"unknown drone layout {layout!r}, expected one of {DRONE_LAYOUTS}")
+    boundary = box_boundary(0, 0, env_size, env_size)
+    # Sunflower seeds are well spread and deterministic
+    k = np.arange(n) + 0.5
+    radius = np.sqrt(k / n) * env_size / 2
+    angle = k * math.pi * (3 - math.sqrt(5))
+    seeds = env_size / 2 + np.column_stack([radius * np.cos(angle), radius * np.sin(angle)])
+    for _ in range(iterations):
+        cells = power_cells(seeds, 0.0, boundary)
+        seeds = np.where(cells.valid[:, None], cells.centroids, seeds)
+    cells = power_cells(seeds, 0.0, boundary)
+    return [cells.vertices(k) for k in range(n)]
+
+
+class DroneFleet:
+    """M drones, each sweeping its own region of the workspace.
+
+    All sweeps share one ArcPath and update() places every drone at once,
+    at the distance flown so far along its own path. The sweep paths come
+    from drone_regions() and sweep_path(), with lanes sensor_range * sqrt(2)
+    apart so that each region is fully covered.
+    """
+    def __init__(self, env_size, n=1, layout='strips', dt=1 / 60, sensor_range=100):
+        self.env_size = env_size
+        self.n = n
+        self.dt = dt
+        self.sensor_range = sensor_range
+        paths = [sweep_path(region, sensor_range * math.sqrt(2)) for region in drone_regions(env_size, n, layout)]
+        self.arc = ArcPath(paths)
+        self.ticks = 0
+        self.speed = np.full(n, 360.0)  # units per second
+        self._rows = np.arange(n)
+        self.pos = self.position_at(0)
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def x(self):
+        return self.pos[:, 0]
+
+    @property
+    def y(self):
+        return self.pos[:, 1]
+
+    def position_at(self, ticks):
+        """Positions of all drones after the given number of updates.
+
+        ticks may be an array; the result then holds one (M, 2) block per entry.
+        """
+        return self.arc.position(np.multiply.outer(ticks, self.speed * self.dt), self._rows)
+
+    def update(self):
+        """Advance every drone by one step of dt seconds."""
+        self.ticks += 1
+        self.pos = self.position_at(self.ticks)
+
+    def sees(self, points):
+        """Mask of the points within sensor range of any drone."""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if len(points) == 0:
+            return np.zeros(0, dtype=bool)
+        distance, _ = cKDTree(self.pos).query(points)
+        return distance <= self.sensor_range
+
+
+def _fleet_column(name, col=None):
+    """Property reading and writing one cell of a Fleet array."""
+    def fget(self):
+        row = getattr(self.fleet, name)[self.index]
+        return float(row if col is None else row[col])
+
+    def fset(self, value):
+        if col is None:
+            getattr(self.fleet, name)[self.index] = value
+        else:
+            getattr(self.fleet, name)[self.index, col] = value
+    return property(fget, fset)
+
+def _fleet_flag(bit):
+    """Property exposing one bit of the Fleet state mask as a bool."""
+    def fget(self):
+        return bool(self.fleet.state[self.index] & bit)
+
+    def fset(self, value):
+        if value:
+            self.fleet.set_bits(self.index, bit)
+        else:
+            self.fleet.clear_bits(self.index, bit)
+    return property(fget, fset)
+
 class Car:
-    def __init__(self, x, y, env_size):
-        self.x = x
-        self.y = y
+    x = _fleet_column('pos', 0)
+    y = _fleet_column('pos', 1)
+    dx_total = _fleet_column('vel', 0)
+    dy_total = _fleet_column('vel', 1)
+    last_x = _fleet_column('last_pos', 0)
+    last_y = _fleet_column('last_pos', 1)
+    speed = _fleet_column('speed')
+    size = _fleet_column('size')
+    has_item = _fleet_flag(HAS_ITEM)
+    delivering = _fleet_flag(DELIVERING)
+    assigned_task = _fleet_flag(ASSIGNED)
+    just_delivered = _fleet_flag(JUST_DELIVERED)
+
+    def __init__(self, x, y, env_size, fleet=None):
+        if fleet is None:
+            fleet = Fleet(env_size)
+        self.fleet = fleet
+        self.index = fleet.add(self, x, y)
         self.size = 10
         self.color = (255, 0, 0)
         self.env_size = env_size
-        self.speed = 4
+        self.speed = 240  # units per second
         self.K_att = 1.0
-        self.centroid = (x, y)
-        self.has_item = False
         self.item_color = None
-        self.target_item = None
-        self.delivering = False
-        self.just_delivered = False
-        self.assigned_task = False
+        self._target_item = None
         # Experiments parameters
-        self.last_x = x
-        self.last_y = y
         self.current_item = None
 
+    @property
+    def centroid(self):
+        return tuple(self.fleet.target[self.index].tolist())
+
+    @centroid.setter
+    def centroid(self, value):
+        self.fleet.target[self.index] = value
+
+    @property
+    def target_item(self):
+        return self._target_item
+
+    @target_item.setter
+    def target_item(self, item):
+        self._target_item = item
+        if item is None:
+            self.fleet.item_pos[self.index] = np.nan
+        else:
+            self.fleet.item_pos[self.index] = (item.x, item.y)
+            self.fleet.reach[self.index] = self.size + item.size
+
     def set_target(self, item):
         """Assign item and move to pick it up."""
         self.centroid = (item.x, item.y)
         self.target_item = item
         self.assigned_task = True
-        print(f"Car at ({self.x:.2f}, {self.y:.2f}) is heading to the item.")
-
-    def update(self, cars, ENV_SIZE, polygon):
-        """Update car position."""
-        dx_total = 0
-        dy_total = 0
-
-        if self.has_item and not self.delivering:
-            self.delivering = True
-            radius = 40
-            angle = random.uniform(180, 270)
-            rad = math.radians(angle)
-            self.centroid = (ENV_SIZE + radius * math.cos(rad), ENV_SIZE + radius * math.sin(rad))
-            print(f"Car at ({self.x:.2f}, {self.y:.2f}) is delivering the item.")
-
-        if self.delivering:
-            dx = self.centroid[0] - self.x
-            dy = self.centroid[1] - self.y
-            distance_to_target = math.hypot(dx, dy)
-            if distance_to_target > 0:
-                dx_norm = (dx / distance_to_target) * min(distance_to_target, self.speed)
-                dy_norm = (dy / distance_to_target) * min(distance_to_target, self.speed)
-            else:
-                dx_norm, dy_norm = 0, 0
-
-            dx_total += dx_norm
-            dy_total += dy_norm
-        else:
-            dx = self.centroid[0] - self.x
-            dy = self.centroid[1] - self.y
-            distance_to_target = math.hypot(dx, dy)
-            if distance_to_target > 0:
-                dx_norm = (dx / distance_to_target) * min(distance_to_target, self.speed)
-                dy_norm = (dy / distance_to_target) * min(distance_to_target, self.speed)
-            else:
-                dx_norm, dy_norm = 0, 0
-
-            dx_total += dx_norm
-            dy_total += dy_norm
-
-        # Repulsive force from other cars
-        for other_car in cars:
-            if other_car != self:
-                dx_oc = self.x - other_car.x
-                dy_oc = self.y - other_car.y
-                distance_oc = math.hypot(dx_oc, dy_oc)
-                if distance_oc <= 50:
-                    k = 1500
-                    force_magnitude = k / (distance_oc ** 2 + 1e-8)
-                    unit_vector = np.array([dx_oc, dy_oc]) / (distance_oc + 1e-8)
-                    repulsive_force = force_magnitude * unit_vector
-
-                    dx_total += repulsive_force[0]
-                    dy_total += repulsive_force[1]
-
-                    other_car.dx_total -= repulsive_force[0]
-                    other_car.dy_total -= repulsive_force[1]
-
-        self.dx_total += dx_total
-        self.dy_total += dy_total
-
-    def update_nml(self, cars, ENV_SIZE, polygon):
-            dx_total = 0
-            dy_total = 0
-
-            if self.has_item and not self.delivering:
-                self.delivering = True
-                radius = 40
-                angle = random.uniform(180, 270)
-                rad = math.radians(angle)
-                self.centroid = (ENV_SIZE + radius * math.cos(rad),
-                                 ENV_SIZE + radius * math.sin(rad))
-                print(f"Car at ({self.x:.2f}, {self.y:.2f}) is delivering the item.")
-
-            dx = self.centroid[0] - self.x
-            dy = self.centroid[1] - self.y
-            distance_to_target = math.hypot(dx, dy)
-            if distance_to_target > 0:
-                dx_norm = (dx / distance_to_target) * min(distance_to_target, self.speed)
-                dy_norm = (dy / distance_to_target) * min(distance_to_target, self.speed)
-            else:
-                dx_norm, dy_norm = 0, 0
-            dx_total += dx_norm
-            dy_total += dy_norm
-
-            # Repulsive force to avoid collision
-            for other_car in cars:
-                if other_car != self:
-                    dx_oc = self.x - other_car.x
-                    dy_oc = self.y - other_car.y
-                    distance_oc = math.hypot(dx_oc, dy_oc)
-                    if distance_oc <= 50:
-                        k = 1500
-                        force_magnitude = k / (distance_oc ** 2 + 1e-8)
-                        unit_vector = np.array([dx_oc, dy_oc]) / (distance_oc + 1e-8)
-                        repulsive_force = force_magnitude * unit_vector
-                        dx_total += repulsive_force[0]
-                        dy_total += repulsive_force[1]
-
-                        other_car.dx_total -= repulsive_force[0]
-                        other_car.dy_total -= repulsive_force[1]
-
-            self.dx_total += dx_total
-            self.dy_total += dy_total
+        events = self.fleet.events
+        if events.enabled:
+            events.emit(ASSIGN, car=self.index, item=-1 if item.serial is None else item.serial,
+                        x=self.x, y=self.y)
 
     def draw(self, screen):
         """Draw the car."""
@@ -201,12 +352,17 @@ class Car:
             pygame.draw.circle(screen, color, (int(self.x), int(self.y)), 50, 1)
 
 class Item:
-    def __init__(self, env_size):
-        self.x = random.uniform(0, env_size)
-        self.y = random.uniform(0, env_size)
+    def __init__(self, env_size, rng=None, demand=None):
+        if demand is None:
+            self.x = uniform(rng, 0, env_size)
+            self.y = uniform(rng, 0, env_size)
+        else:
+            # Placed where a raster.DemandMap says items appear
+            self.x, self.y = demand.sample(rng)
         self.size = 8
         self.color = (255, 165, 0)
         self.picked = False
+        self.serial = None
 
     def draw(self, screen):
         if not self.picked:
@@ -1,11 +1,57 @@
+import argparse
+import os
+import tempfile
 import pygame
 import random
-import math
 import numpy as np
 from scipy.spatial import Voronoi
-from shapely.geometry import Point, Polygon
 from robots import *
 from utils import *
+from assignment import NearestAssigner, BatchAssigner
+from detection import DetectionScheduler, SweepDetector
+from items import ItemStore, LifecycleArchive
+from events import EventLog, ConsoleSink, DEBUG, DETECT, SPAWN
+from render import Renderer
+from power import power_cells, fleet_weights
+from kinetic import KineticVoronoi
+from raster import RasterPartition, DemandMap
+from profiling import Profiler, Overlay
+from simclock import SimClock
+
+parser = argparse.ArgumentParser(description="Interactive weighted VSP-based task allocation simulation.")
+parser.add_argument('--cars', type=int, default=12, help='number of ground vehicles')
+parser.add_argument('--partition', choices=['voronoi', 'power', 'kinetic', 'raster'], default='voronoi',
+                    help='space partition: scipy Voronoi, the weighted power diagram, the '
+                         'kinetic Voronoi diagram that skips unneeded rebuilds or a labelled raster')
+parser.add_argument('--raster-resolution', type=float, default=10.0,
+                    help='grid cell size of the raster partition')
+parser.add_argument('--demand', default=None,
+                    help='.npy file with a 2-D item probability raster (default: uniform)')
+parser.add_argument('--assigned-weight', type=float, default=None,
+                    help='power weight of cars with a task (default: drop them from the diagram)')
+parser.add_argument('--speed-horizon', type=float, default=0.0,
+                    help='seconds of travel that set the power weight of free cars')
+parser.add_argument('--assign', choices=['nearest', 'batch'], default='nearest',
+                    help='give each detected item to the owner of its cell, or match batches of '
+                         'items to free cars with linear_sum_assignment')
+parser.add_argument('--batch-window', type=float, default=0.0,
+                    help='seconds detected items are collected before a batch is matched')
+parser.add_argument('--batch-candidates', type=int, default=8,
+                    help='nearest cars considered for each item of a batch')
+parser.add_argument('--workload-cost', type=float, default=50.0,
+                    help='distance added per task a car has delivered when matching batches')
+parser.add_argument('--dt', type=float, default=1 / 60, help='physics time step in simulated seconds')
+parser.add_argument('--substeps', type=int, default=1, help='physics steps per partition/render frame')
+parser.add_argument('--drones', type=int, default=None,
+                    help='number of drones sweeping their own regions (default: one zigzag drone)')
+parser.add_argument('--drone-layout', choices=DRONE_LAYOUTS, default='strips',
+                    help='how the workspace is split between the drones')
+parser.add_argument('--profile', default=None,
+                    help='time every stage of the frame loop and dump the histograms to this JSON file at exit')
+parser.add_argument('--lifecycle', default=None,
+                    help='archive the lifecycle rows of delivered items to this file (default: a temporary file)')
+parser.add_argument('--overlay', action='store_true', help='draw the stage timings on the window')
+args = parser.parse_args()
 
 pygame.init()
 
@@ -13,140 +59,169 @@ ENV_SIZE = 800
 screen = pygame.display.set_mode((ENV_SIZE, ENV_SIZE))
 pygame.display.set_caption("Weighted VSP-based Task Allocation Simulation - Voronoi")
 clock = pygame.time.Clock()
-
-drone = Drone(0, 0, ENV_SIZE)
-
+renderer = Renderer(ENV_SIZE)
+profiler = Profiler(enabled=bool(args.profile) or args.overlay)
+overlay = Overlay(profiler) if args.overlay else None
+sim = SimClock(args.dt, args.substeps)
+demand = DemandMap.load(args.demand, ENV_SIZE) if args.demand else None
+
+if args.drones is None:
+    drone = Drone(0, 0, ENV_SIZE, dt=sim.dt)
+else:
+    drone = DroneFleet(ENV_SIZE, args.drones, args.drone_layout, dt=sim.dt)
+
+events = EventLog([ConsoleSink()], level=DEBUG)
+fleet = Fleet(ENV_SIZE, events=events, profiler=profiler, dt=sim.dt)
 cars = []
-for _ in range(12):
+for _ in range(args.cars):
     x = random.uniform(0, ENV_SIZE)
     y = random.uniform(0, ENV_SIZE)
-    car = Car(x, y, ENV_SIZE)
+    car = Car(x, y, ENV_SIZE, fleet=fleet)
     cars.append(car)
 
-items = [Item(ENV_SIZE) for _ in range(8)]
-items_detected = [False] * len(items)
+lifecycle_path = args.lifecycle
+if lifecycle_path is None:
+    fd, lifecycle_path = tempfile.mkstemp(suffix='.lifecycle')
+    os.close(fd)
+store = ItemStore(archive=LifecycleArchive(lifecycle_path))
+deliveries = np.zeros(len(cars), dtype=np.int64)
+batch = None
+if args.assign == 'batch':
+    batch = BatchAssigner(round(args.batch_window * sim.rate), args.batch_candidates, args.workload_cost)
+scheduler = DetectionScheduler(drone) if args.drones is None else SweepDetector(drone)
+for _ in range(8):
+    item = Item(ENV_SIZE, demand=demand)
+    serial = store.add(item, 1)
+    scheduler.schedule(serial, item.x, item.y, 1)
+
+boundary = box_boundary(0, 0, ENV_SIZE, ENV_SIZE)
+kinetic = KineticVoronoi(boundary, profiler) if args.partition == 'kinetic' else None
+raster = RasterPartition(ENV_SIZE, args.raster_resolution, demand) if args.partition == 'raster' else None
 
 running = True
 while running:
+    sim.new_frame()
+    profiler.lap('frame')
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
             running = False
 
-    drone.update()
-    active_cars = [car for car in cars if not car.assigned_task]
-
-    if len(active_cars) > 0:
-        points = np.array([[car.x, car.y] for car in active_cars])
-        vor = Voronoi(points)
-        regions, vertices = voronoi_finite_polygons_2d(vor, ENV_SIZE)
+    first_tick = sim.ticks + 1
+    with profiler.span('drone'):
+        for _ in range(sim.substeps):
+            drone.update()
+            sim.tick()
+    tick = sim.ticks
+    # Events are stamped with the physics step, as the item lifecycles are
+    events.frame = tick
+    weights = None
+    if args.partition in ('power', 'raster'):
+        with profiler.span('partition'):
+            weights = fleet_weights(fleet, args.assigned_weight, args.speed_horizon)
+            active_idx = np.flatnonzero(np.isfinite(weights))
+            if raster is not None:
+                cells = raster.cells(fleet.pos[active_idx], weights[active_idx])
+            else:
+                cells = power_cells(fleet.pos[active_idx], weights[active_idx], boundary)
     else:
-        vor = None
-        regions, vertices = [], []
-
-    min_x = 0
-    max_x = ENV_SIZE
-    min_y = 0
-    max_y = ENV_SIZE
-    boundary = Polygon([(min_x, min_y), (min_x, max_y), (max_x, max_y), (max_x, min_y)])
-    car_polygons = {car: None for car in cars}
-
-    if vor is not None:
-        for idx, region in enumerate(regions):
-            car = active_cars[idx]
-            polygon = vertices[region]
-            poly = Polygon(polygon)
-            poly = poly.intersection(boundary)
-            if not poly.is_empty and poly.is_valid and poly.geom_type == 'Polygon':
-                car_polygons[car] = poly
-                centroid = poly.centroid.coords[0]
-                if not car.target_item and not car.delivering:
-                    car.centroid = centroid
-
-    for idx, item in enumerate(items):
-        if not items_detected[idx] and not item.picked:
-            dx = item.x - drone.x
-            dy = item.y - drone.y
-            distance = math.hypot(dx, dy)
-            if distance <= drone.sensor_range:
-                items_detected[idx] = True
-                print(f"Drone has detected item {idx + 1}.")
-                item_point = Point(item.x, item.y)
-                for car, poly in car_polygons.items():
-                    if poly and poly.contains(item_point):
-                        car.set_target(item)
-                        print(f"Car at ({car.x:.2f}, {car.y:.2f}) has been assigned to pick up item {idx + 1}.")
-                        break
-
-    for car in cars:
-        car.dx_total = 0
-        car.dy_total = 0
-
-    for car in cars:
-        polygon = car_polygons[car]
-        car.update(cars, ENV_SIZE, polygon)
-
-    for car in cars:
-        total_speed = math.hypot(car.dx_total, car.dy_total)
-        if total_speed > car.speed:
-            scale = car.speed / total_speed
-            car.dx_total *= scale
-            car.dy_total *= scale
-
-        car.x += car.dx_total
-        car.y += car.dy_total
-
-        if car.delivering:
-            dx = car.centroid[0] - car.x
-            dy = car.centroid[1] - car.y
-            distance_to_target = math.hypot(dx, dy)
-            if distance_to_target < car.speed:
-                car.has_item = False
-                car.delivering = False
-                car.item_color = None
-                car.just_delivered = True
-                car.assigned_task = False
-                print(f"Car at ({car.x:.2f}, {car.y:.2f}) has delivered the item.")
-
-        if car.target_item and not car.has_item:
-            dx_item = car.target_item.x - car.x
-            dy_item = car.target_item.y - car.y
-            distance = math.hypot(dx_item, dy_item)
-            if distance < car.size + car.target_item.size:
-                car.has_item = True
-                car.item_color = car.target_item.color
-                car.target_item.picked = True
-                car.target_item = None
-                print(f"Car at ({car.x:.2f}, {car.y:.2f}) has picked up the item.")
-
-    deliveries = False
-    for car in cars:
-        if car.just_delivered:
-            deliveries = True
-            car.just_delivered = False
-
-    if deliveries:
-        new_items = [Item(ENV_SIZE) for _ in range(1)]
-        items.extend(new_items)
-        items_detected.extend([False] * len(new_items))
-        print("Three new items have been generated.")
-
-    screen.fill((255, 255, 255))
-
-    draw_quarter_circle(screen, (ENV_SIZE, ENV_SIZE), 40, (255, 182, 193), ENV_SIZE)
-
-    for poly in car_polygons.values():
-        if poly and poly.exterior:
-            x, y = poly.exterior.coords.xy
-            coords = [(int(xx), int(yy)) for xx, yy in zip(x, y)]
-            pygame.draw.polygon(screen, (0, 255, 0), coords, 1)
-
-    drone.draw(screen)
-    for car in cars:
-        car.draw(screen)
-    for item in items:
-        item.draw(screen)
-
-    pygame.display.flip()
-    clock.tick(60)
-
+        active_idx = np.flatnonzero(~fleet.has(ASSIGNED))
+        if kinetic is not None:
+            with profiler.span('partition'):
+                cells = kinetic.cells(fleet.pos[active_idx], active_idx)
+        elif len(active_idx) > 0:
+            points = fleet.pos[active_idx]
+            with profiler.span('voronoi'):
+                vor = Voronoi(points)
+            with profiler.span('closure'):
+                _, vertices, indices, offsets = voronoi_finite_polygons_2d(vor, ENV_SIZE, csr=True)
+            with profiler.span('clip'):
+                cells = clip_convex_cells(indices, offsets, vertices, boundary)
+        else:
+            cells = Cells.empty()
+
+    # Idle cars head for the centroid of their cell
+    owners = active_idx[cells.valid]
+    free = ~fleet.has_target_item()[owners] & ~fleet.has(DELIVERING)[owners]
+    fleet.target[owners[free]] = cells.centroids[cells.valid][free]
+
+    detected = []
+    with profiler.span('detect'):
+        for serial in scheduler.due(tick):
+            item = store.get(serial)
+            if item is not None and not item.picked:
+                store.record(serial, 'detect', tick)
+                if events.enabled:
+                    events.emit(DETECT, item=serial)
+                detected.append(item)
+
+    if batch is not None:
+        for item in detected:
+            if store.frame_of(item.serial, 'assign') < 0:
+                batch.offer(item, tick)
+        if batch.ready(tick):
+            with profiler.span('assign'):
+                takers = np.flatnonzero(~fleet.has(ASSIGNED))
+                pending = batch.pending()
+                owners = batch.match([(item.x, item.y) for item in pending], fleet.pos[takers],
+                                     takers, deliveries[takers])
+                for item, owner in zip(pending, owners):
+                    if owner >= 0:
+                        cars[owner].set_target(item)
+                        store.record(item.serial, 'assign', tick, car=owner)
+                        batch.settle(item)
+    elif detected:
+        with profiler.span('assign'):
+            if weights is None:
+                assigner = NearestAssigner(fleet.pos[active_idx], active_idx)
+            else:
+                # Busy cars keep their (small) cell but take no new items
+                takers = active_idx[~fleet.has(ASSIGNED)[active_idx]]
+                assigner = NearestAssigner(fleet.pos[takers], takers, weights[takers])
+            owners = assigner.query([(item.x, item.y) for item in detected])
+            for item, owner in zip(detected, owners):
+                if owner >= 0:
+                    car = cars[owner]
+                    car.set_target(item)
+                    store.record(item.serial, 'assign', tick, car=owner)
+
+    for step_tick in range(first_tick, tick + 1):
+        events.frame = step_tick
+        with profiler.span('step'):
+            picked, delivered = fleet.step()
+
+        with profiler.span('bookkeeping'):
+            for i in picked:
+                store.record(cars[i].current_item.serial, 'pickup', step_tick)
+            for i in delivered:
+                car = cars[i]
+                deliveries[i] += 1
+                if car.current_item is not None and store.get(car.current_item.serial) is not None:
+                    store.finish(car.current_item.serial, step_tick)
+                car.current_item = None
+
+            if len(delivered) > 0:
+                new_items = [Item(ENV_SIZE, demand=demand) for _ in range(1)]
+                for item in new_items:
+                    serial = store.add(item, step_tick)
+                    scheduler.schedule(serial, item.x, item.y, step_tick + 1)
+                    if events.enabled:
+                        events.emit(SPAWN, item=serial, x=item.x, y=item.y)
+
+    with profiler.span('draw'):
+        rects = renderer.draw_live(screen, drone, fleet, store.live(), cells)
+    if overlay is not None:
+        with profiler.span('overlay'):
+            rects = renderer.touch(rects, overlay.draw(screen))
+    with profiler.span('display'):
+        pygame.display.update(rects)
+    with profiler.span('tick'):
+        clock.tick(sim.frame_rate)
+
+events.close()
+store.archive.flush()
+if args.lifecycle is None:
+    os.remove(lifecycle_path)
 pygame.quit()
+if args.profile:
+    profiler.dump(args.profile)
+    print(profiler.report())
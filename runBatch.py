@@ -0,0 +1,73 @@
+import os
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import json
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy import stats
+from runExpts import run_experiment
+from events import NULL_LOG
+
+MODES = {'nml': False, 'vor': True}
+
+
+def run_seed(task):
+    """Worker: run one headless experiment with its own RNG stream."""
+    mode, seed_seq = task
+    rng = np.random.default_rng(seed_seq)
+    results = run_experiment(voronoi=MODES[mode], headless=True, rng=rng, events=NULL_LOG)[-1]
+    return mode, {k: float(v) for k, v in results.items()}
+
+
+def summarize(samples, confidence=0.95):
+    """Mean, standard deviation and confidence interval of every results key."""
+    summary = {}
+    for key in samples[0]:
+        values = np.array([s[key] for s in samples])
+        n = len(values)
+        mean = values.mean()
+        std = values.std(ddof=1) if n > 1 else 0.0
+        half = stats.t.ppf((1 + confidence) / 2, n - 1) * std / np.sqrt(n) if n > 1 else 0.0
+        summary[key] = {'mean': mean, 'std': std, 'ci_low': mean - half, 'ci_high': mean + half, 'n': n}
+    return summary
+
+
+def run_batch(n_seeds, seed=None, workers=None, modes=('nml', 'vor')):
+    """Run n_seeds experiments per mode across a process pool.
+
+    Every seed gets an independent stream spawned from one SeedSequence, and
+    the same stream is used for each mode so the modes are compared on
+    identical item and car layouts.
+    """
+    children = np.random.SeedSequence(seed).spawn(n_seeds)
+    tasks = [(mode, child) for child in children for mode in modes]
+    samples = {mode: [] for mode in modes}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for mode, results in pool.map(run_seed, tasks):
+            samples[mode].append(results)
+    return {mode: summarize(samples[mode]) for mode in modes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo comparison of fixed and dynamic VSP-based task allocation.")
+    parser.add_argument('--seeds', type=int, default=100, help='number of seeds per mode')
+    parser.add_argument('--seed', type=int, default=None, help='root seed for the SeedSequence')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--json', default=None, help='write the summary to this JSON file')
+    args = parser.parse_args()
+
+    summary = run_batch(args.seeds, seed=args.seed, workers=args.workers)
+    for mode, keys in summary.items():
+        print(f"========== Experiment {mode} over {args.seeds} seeds ==========")
+        for k, s in keys.items():
+            print(f"{k}: {s['mean']:.4f} +/- {s['std']:.4f} (95% CI {s['ci_low']:.4f} .. {s['ci_high']:.4f})")
+        print("====================================")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2, default=float)
+
+
+if __name__ == '__main__':
+    main()
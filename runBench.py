@@ -0,0 +1,239 @@
+import os
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+import numpy as np
+from scipy.spatial import Voronoi
+from robots import *
+from utils import *
+from assignment import NearestAssigner
+from detection import DetectionScheduler
+from items import ItemStore
+from metrics import RunMetrics
+from profiling import Profiler
+
+ENV_SIZE = 800
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+PHASES = ['drone', 'voronoi', 'closure', 'clip', 'targets', 'detect', 'assign', 'repulsion', 'integrate', 'deliver',
+          'metrics']
+# (cars, items per car, timed frames)
+CASES = [
+    (12, 0.67, 3000),
+    (100, 0.67, 1000),
+    (100, 4.0, 1000),
+    (1000, 0.67, 60),
+    (1000, 4.0, 60),
+    (10000, 0.67, 10),
+]
+
+
+def case_name(n_cars, density):
+    return f"n={n_cars},items/car={density:g}"
+
+
+class Scene:
+    """The headless Voronoi experiment of runExpts.py, split into timed phases."""
+    def __init__(self, n_cars, density, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.drone = Drone(0, 0, ENV_SIZE)
+        # The fleet times its repulsion in a span; the rest of Fleet.step is the integration
+        self.profiler = Profiler()
+        self.fleet = Fleet(ENV_SIZE, rng=self.rng, profiler=self.profiler)
+        self.cars = [Car(uniform(self.rng, 0, ENV_SIZE), uniform(self.rng, 0, ENV_SIZE), ENV_SIZE, fleet=self.fleet)
+                     for _ in range(n_cars)]
+        self.metrics = RunMetrics(n_cars)
+        self.store = ItemStore()
+        self.scheduler = DetectionScheduler(self.drone)
+        for _ in range(max(1, round(density * n_cars))):
+            self.spawn(1, 1)
+        self.boundary = box_boundary(0, 0, ENV_SIZE, ENV_SIZE)
+        self.frame = 0
+
+    def spawn(self, frame, due):
+        item = Item(ENV_SIZE, self.rng)
+        serial = self.store.add(item, frame)
+        self.scheduler.schedule(serial, item.x, item.y, due)
+
+    def step(self, times):
+        """Run one frame, writing the duration of every phase (in ns) into times."""
+        fleet, store = self.fleet, self.store
+        clock = time.perf_counter_ns
+        self.frame += 1
+        frame = self.frame
+
+        t0 = clock()
+        self.drone.update()
+        t1 = clock()
+        generator_idx = np.flatnonzero(~fleet.has(ASSIGNED))
+        # Dense item layouts can leave fewer free cars than Qhull needs
+        if len(generator_idx) >= 3:
+            vor = Voronoi(fleet.pos[generator_idx])
+            t2 = clock()
+            _, vertices, indices, offsets = voronoi_finite_polygons_2d(vor, csr=True)
+            t3 = clock()
+            cells = clip_convex_cells(indices, offsets, vertices, self.boundary)
+        else:
+            t2 = t3 = clock()
+            cells = Cells.empty()
+            generator_idx = generator_idx[:0]
+        t4 = clock()
+        owners = generator_idx[cells.valid]
+        free = ~fleet.has_target_item()[owners] & ~fleet.has(DELIVERING)[owners]
+        fleet.target[owners[free]] = cells.centroids[cells.valid][free]
+        t5 = clock()
+        detected = []
+        for serial in self.scheduler.due(frame):
+            item = store.get(serial)
+            if item is not None and not item.picked:
+                store.record(serial, 'detect', frame)
+                detected.append(item)
+        t6 = clock()
+        if detected:
+            assigner = NearestAssigner(fleet.pos[generator_idx], generator_idx)
+            for item, owner in zip(detected, assigner.query([(item.x, item.y) for item in detected])):
+                if owner >= 0:
+                    self.cars[owner].set_target(item)
+                    store.record(item.serial, 'assign', frame, car=owner)
+                    self.metrics.assign(owner, item.serial)
+        t7 = clock()
+        picked, delivered = fleet.step()
+        t8 = clock()
+        repulsion = self.profiler.span('repulsion').last
+        for i in picked:
+            store.record(self.cars[i].current_item.serial, 'pickup', frame)
+            self.metrics.pickup(i)
+        for i in delivered:
+            car = self.cars[i]
+            lifecycle = None
+            if car.current_item is not None and store.get(car.current_item.serial) is not None:
+                lifecycle = frame - store.finish(car.current_item.serial, frame)['appear']
+            car.current_item = None
+            self.metrics.deliver(i, lifecycle)
+        # One new item per step with any delivery, as in runExpts.py
+        if len(delivered) > 0:
+            self.spawn(frame, frame + 1)
+        t9 = clock()
+        self.metrics.sample_overlap()
+        self.metrics.end_frame(int(np.count_nonzero(fleet.idle())), int(np.count_nonzero(fleet.busy())))
+        self.metrics.task_std  # read every frame, as runExpts.py does
+        t10 = clock()
+        times[:] = np.diff([t0, t1, t2, t3, t4, t5, t6, t7, t7 + repulsion, t8, t9, t10])
+
+
+def bench_case(n_cars, density, frames, warmup=5, seed=0):
+    """Timings of one case: per-phase and per-frame p50/p99 in ms, and the
+    peak memory allocated while a frame runs."""
+    scene = Scene(n_cars, density, seed)
+    times = np.zeros((frames, len(PHASES)), dtype=np.int64)
+    for _ in range(warmup):
+        scene.step(times[0])
+    for f in range(frames):
+        scene.step(times[f])
+
+    # Peak memory of a few extra frames, measured separately since tracing slows them down
+    tracemalloc.start()
+    scratch = np.zeros(len(PHASES), dtype=np.int64)
+    for _ in range(min(frames, 5)):
+        scene.step(scratch)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    ms = times / 1e6
+    total = ms.sum(axis=1)
+    result = {
+        'cars': n_cars,
+        'items_per_car': density,
+        'frames': frames,
+        'frame_ms': {'p50': float(np.percentile(total, 50)), 'p99': float(np.percentile(total, 99))},
+        'phases_ms': {phase: {'p50': float(np.percentile(ms[:, k], 50)), 'p99': float(np.percentile(ms[:, k], 99))}
+                      for k, phase in enumerate(PHASES)},
+        'peak_frame_mb': peak / 2 ** 20,
+    }
+    return result
+
+
+def compare(results, baseline, threshold, floor_ms):
+    """Regressions of the p50 frame and phase times against a baseline.
+
+    A timing regresses when it is more than `threshold` (relative) and
+    `floor_ms` (absolute) slower than its baseline; the floor keeps
+    scheduling jitter on sub-millisecond phases from failing the run.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        pairs = [('frame', result['frame_ms'], base['frame_ms'])]
+        pairs += [(phase, result['phases_ms'][phase], base['phases_ms'][phase])
+                  for phase in PHASES if phase in base['phases_ms']]
+        for label, now, then in pairs:
+            if now['p50'] > then['p50'] * (1 + threshold) and now['p50'] - then['p50'] > floor_ms:
+                regressions.append(f"{name} {label}: p50 {now['p50']:.3f} ms vs baseline {then['p50']:.3f} ms "
+                                   f"(+{100 * (now['p50'] / then['p50'] - 1):.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-phase scaling benchmark of the headless simulation step.")
+    parser.add_argument('--cars', type=int, nargs='*', default=None, help='only run cases with these fleet sizes')
+    parser.add_argument('--frames', type=float, default=1.0, help='scale the number of timed frames per case')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline JSON to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative slowdown of a p50 time')
+    parser.add_argument('--floor-ms', type=float, default=0.1, help='ignore slowdowns smaller than this')
+    parser.add_argument('--json', default=None, help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = {}
+    for n_cars, density, frames in CASES:
+        if args.cars and n_cars not in args.cars:
+            continue
+        name = case_name(n_cars, density)
+        result = bench_case(n_cars, density, max(3, round(frames * args.frames)))
+        results[name] = result
+        print(f"========== {name} ({result['frames']} frames) ==========")
+        print(f"frame: p50 {result['frame_ms']['p50']:.3f} ms  p99 {result['frame_ms']['p99']:.3f} ms  "
+              f"peak frame memory {result['peak_frame_mb']:.2f} MB")
+        for phase, t in result['phases_ms'].items():
+            print(f"  {phase:<9} p50 {t['p50']:9.3f} ms  p99 {t['p99']:9.3f} ms")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        # Cases that were not run keep their old baseline
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold, args.floor_ms)
+    if regressions:
+        print("====================================")
+        print(f"PERFORMANCE REGRESSION: {len(regressions)} timing(s) more than "
+              f"{100 * args.threshold:.0f}% slower than {args.baseline}")
+        for line in regressions:
+            print("  " + line)
+        sys.exit(1)
+    print("====================================")
+    print(f"No regressions against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
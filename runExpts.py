@@ -1,329 +1,362 @@
+import argparse
+import os
+import tempfile
 import pygame
-import random
-import math
 import numpy as np
 from scipy.spatial import Voronoi
-from shapely.geometry import Point, Polygon
 import matplotlib.pyplot as plt
 from robots import *
 from utils import *
-
-def run_experiment(voronoi=True):
+from assignment import NearestAssigner, BatchAssigner
+from detection import DetectionScheduler, SweepDetector
+from items import ItemStore, LifecycleArchive
+from metrics import RunMetrics
+from timeseries import SeriesWriter
+from recording import TrajectoryRecorder
+from export import FrameExporter
+from render import Renderer
+from power import power_cells, fleet_weights
+from kinetic import KineticVoronoi
+from raster import RasterPartition, DemandMap
+from profiling import Profiler, Overlay, NULL_PROFILER
+from simclock import SimClock
+from events import EventLog, ConsoleSink, JsonlSink, DEBUG, LEVELS, DETECT, SPAWN
+
+SERIES_COLUMNS = [
+    ('boxes_delivered', np.int64),
+    ('std_task', np.float64),
+    ('idle_ratio', np.float64),
+    ('box_delivery_eff', np.float64),
+    ('busy_cars', np.int64),
+]
+
+def run_experiment(voronoi=True, headless=False, rng=None, series_path=None, events=None,
+                   record_path=None, exporter=None, partition='voronoi', assigned_weight=None,
+                   speed_horizon=0.0, profiler=None, overlay=False, dt=1 / 60, substeps=1,
+                   duration=60.0, drones=None, drone_layout='strips', raster_resolution=10.0,
+                   demand=None, assign='nearest', batch_window=0.0, batch_candidates=8,
+                   workload_cost=50.0, lifecycle_path=None):
+    """Run an experiment over `duration` simulated seconds.
+
+    With headless=True no window is opened, no events are pumped and the
+    frame rate is not throttled, so the run finishes as fast as the CPU allows.
+    rng is a NumPy Generator driving item spawns, car start positions and
+    delivery points; without one the global random module is used.
+    With series_path the per-frame metrics are streamed to that directory
+    (see timeseries.SeriesReader) as the run progresses. Simulation events
+    go to `events` (an events.EventLog); by default they are printed.
+    With record_path every frame is recorded there for replay.py, and an
+    export.FrameExporter gets every k-th frame drawn off-screen, also when
+    headless.
+
+    partition='power' replaces the Voronoi diagram with a power diagram of
+    weighted cars (power.fleet_weights): assigned_weight is the weight of
+    cars with a task (None drops them, as the Voronoi partition does) and
+    speed_horizon scales the weight of free cars with their speed. In the
+    fixed (nml) mode every car keeps weight 0. partition='kinetic' computes
+    the same cells as 'voronoi' with kinetic.KineticVoronoi, which keeps
+    the triangulation between frames and edits it locally as cars move,
+    join and leave the generator set. partition='raster' labels a grid of
+    raster_resolution units by the nearest car, weighted as for 'power',
+    and sends free cars to the demand-weighted centroid of their region
+    (raster.RasterPartition).
+
+    demand is a raster.DemandMap: items then appear where it says and the
+    raster partition weighs its centroids by it. By default items are
+    spread uniformly.
+
+    Every stage of the frame loop is timed by `profiler` (a
+    profiling.Profiler); with overlay=True the timings are also drawn on
+    the window.
+
+    Time advances on a simclock.SimClock: the cars and the drone move in
+    physics steps of dt seconds, `substeps` of them per frame, while the
+    partition, detection, recording and drawing run once per frame. Speeds
+    are in units per second and all reported times are simulated seconds,
+    so a coarser dt or more substeps cover the same duration in fewer frames.
+
+    By default one drone flies the original zigzag and detection times are
+    precomputed along it (detection.DetectionScheduler). With drones=M a
+    robots.DroneFleet of M drones sweeps the regions of drone_layout
+    ('strips' or 'voronoi') and a detection.SweepDetector checks all
+    waiting items against all sensors every frame.
+
+    assign='nearest' gives every detected item to the owner of the cell it
+    lies in (assignment.NearestAssigner). assign='batch' collects detected
+    items for batch_window seconds and matches them one-to-one with free
+    cars on distance plus workload_cost per task already delivered, among
+    the batch_candidates nearest cars of each item
+    (assignment.BatchAssigner); items left without a car wait for the
+    next batch.
+
+    Delivered items are archived to lifecycle_path (items.LifecycleArchive)
+    so memory does not grow with the run; by default to a temporary file
+    that is removed at the end.
+    """
     ENV_SIZE = 800
-    pygame.init()
-    screen = pygame.display.set_mode((ENV_SIZE, ENV_SIZE))
-    if voronoi:
-        pygame.display.set_caption("Experiment Voronoi")
-    else:
-        pygame.display.set_caption("Experiment Nml")
-    clock = pygame.time.Clock()
-
-    FPS = 60
-    FRAMES_PER_MINUTE = 60 * FPS
+    if not headless:
+        pygame.init()
+        screen = pygame.display.set_mode((ENV_SIZE, ENV_SIZE))
+        if voronoi:
+            pygame.display.set_caption("Experiment Voronoi")
+        else:
+            pygame.display.set_caption("Experiment Nml")
+        clock = pygame.time.Clock()
+        renderer = Renderer(ENV_SIZE)
+    if profiler is None:
+        profiler = NULL_PROFILER
+    overlay = Overlay(profiler) if overlay and profiler.enabled and not headless else None
+    if exporter is not None:
+        export_renderer = Renderer(ENV_SIZE)
+
+    sim = SimClock(dt, substeps)
+    n_frames = sim.frames_in(duration)
     frame_count = 0
 
-    deliveries_count = 0
-    car_task_counts = []
-    car_idle_frames = []
-    total_distance_cars = []
-    sum_task_overlap = 0
-    appear_time_dict = {}
-    delivery_time_diffs = []
-    sum_busy_cars = 0
-
-    boxes_delivered_list = []
-    std_task_list = []
-    idle_ratio_list = []
-    box_delivery_eff_list = []
-    busy_cars_list = []
-
-    drone = Drone(0, 0, ENV_SIZE)
+    series = SeriesWriter(SERIES_COLUMNS, path=series_path,
+                          attrs={'voronoi': voronoi, 'fps': sim.frame_rate, 'dt': dt, 'substeps': substeps})
+
+    if drones is None:
+        drone = Drone(0, 0, ENV_SIZE, dt=dt)
+    else:
+        drone = DroneFleet(ENV_SIZE, drones, drone_layout, dt=dt)
+    own_events = events is None
+    if own_events:
+        events = EventLog([ConsoleSink()], level=DEBUG)
+    fleet = Fleet(ENV_SIZE, rng=rng, events=events, profiler=profiler, dt=dt)
     cars = []
     for _ in range(12):
-        x = random.uniform(0, ENV_SIZE)
-        y = random.uniform(0, ENV_SIZE)
-        car = Car(x, y, ENV_SIZE)
+        x = uniform(rng, 0, ENV_SIZE)
+        y = uniform(rng, 0, ENV_SIZE)
+        car = Car(x, y, ENV_SIZE, fleet=fleet)
         cars.append(car)
-    car_idle_frames = [0] * len(cars)
-    total_distance_cars = [0] * len(cars)
-
-    items = [Item(ENV_SIZE) for _ in range(8)]
-    items_detected = [False] * len(items)
-
-    running = True
-    while running:
-        frame_count += 1
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-        
-        if voronoi:
-            drone.update()
-            active_cars = [car for car in cars if not car.assigned_task]
-            if len(active_cars) > 0:
-                points = np.array([[car.x, car.y] for car in active_cars])
-                vor = Voronoi(points)
-                regions, vertices = voronoi_finite_polygons_2d(vor)
-            else:
-                vor = None
-                regions, vertices = [], []
-        else:
-            drone.update()
-            points = np.array([[car.x, car.y] for car in cars])
-            vor = Voronoi(points)
-            regions, vertices = voronoi_finite_polygons_2d(vor)
-
-        boundary = Polygon([
-            (0, 0),
-            (0, ENV_SIZE),
-            (ENV_SIZE, ENV_SIZE),
-            (ENV_SIZE, 0)
-        ])
-
-        car_polygons = {car: None for car in cars}
+    metrics = RunMetrics(len(cars))
+
+    own_lifecycle = lifecycle_path is None
+    if own_lifecycle:
+        fd, lifecycle_path = tempfile.mkstemp(suffix='.lifecycle')
+        os.close(fd)
+    store = ItemStore(archive=LifecycleArchive(lifecycle_path))
+    scheduler = DetectionScheduler(drone) if drones is None else SweepDetector(drone)
+    for _ in range(8):
+        item = Item(ENV_SIZE, rng, demand)
+        serial = store.add(item, 1)
+        scheduler.schedule(serial, item.x, item.y, 1)
+
+    boundary = box_boundary(0, 0, ENV_SIZE, ENV_SIZE)
+    kinetic = KineticVoronoi(boundary, profiler) if partition == 'kinetic' else None
+    batch = None
+    if assign == 'batch':
+        batch = BatchAssigner(round(batch_window * sim.rate), batch_candidates, workload_cost)
+    raster = RasterPartition(ENV_SIZE, raster_resolution, demand) if partition == 'raster' else None
+    recorder = None
+    if record_path is not None:
+        recorder = TrajectoryRecorder(record_path, len(cars), ENV_SIZE,
+                                      attrs={'voronoi': voronoi, 'fps': sim.frame_rate},
+                                      n_drones=1 if drones is None else drones,
+                                      sensor_range=drone.sensor_range)
+
+    try:
+        running = True
+        while running:
+            frame_count = sim.new_frame()
+            profiler.lap('frame')
+            if not headless:
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        running = False
         
-        if voronoi:
-            if vor is not None:
-                for idx, region in enumerate(regions):
-                    car = active_cars[idx]
-                    polygon = vertices[region]
-                    poly = Polygon(polygon)
-                    poly = poly.intersection(boundary)
-                    if not poly.is_empty and poly.is_valid and poly.geom_type == 'Polygon':
-                        car_polygons[car] = poly
-                        if not car.target_item and not car.delivering:
-                            car.centroid = poly.centroid.coords[0]
-
-        else:
-            for idx, region in enumerate(regions):
-                polygon = vertices[region]
-                poly = Polygon(polygon)
-                poly = poly.intersection(boundary)
-                if not poly.is_empty and poly.is_valid and poly.geom_type == 'Polygon':
-                    car_polygons[cars[idx]] = poly
-                    if (not cars[idx].assigned_task and not cars[idx].delivering
-                            and not cars[idx].has_item and not cars[idx].target_item):
-                        cars[idx].centroid = poly.centroid.coords[0]
-
-        for item in items:
-            if item not in appear_time_dict:
-                appear_time_dict[item] = frame_count
-
-        # Attempt item assignment
-        for idx, item in enumerate(items):
-            
-            if voronoi:
-                if not items_detected[idx] and not item.picked:
-                    dx = item.x - drone.x
-                    dy = item.y - drone.y
-                    distance = math.hypot(dx, dy)
-                    if distance <= drone.sensor_range:
-                        items_detected[idx] = True
-                        print(f"Drone has detected item {idx + 1}.")
-                        item_point = Point(item.x, item.y)
-                        for car, poly in car_polygons.items():
-                            if poly and poly.contains(item_point):
-                                car.set_target(item)
-                                print(f"Car at ({car.x:.2f}, {car.y:.2f}) has been assigned to pick up item {idx + 1}.")
-                                break
+            # The drones run ahead over the whole frame; the cars follow in the same steps
+            first_tick = sim.ticks + 1
+            with profiler.span('drone'):
+                for _ in range(sim.substeps):
+                    drone.update()
+                    sim.tick()
+            tick = sim.ticks
+            # Events are stamped with the physics step, as the item lifecycles are
+            events.frame = tick
+            weights = None
+            if partition in ('power', 'raster'):
+                with profiler.span('partition'):
+                    if voronoi:
+                        weights = fleet_weights(fleet, assigned_weight, speed_horizon)
+                    else:
+                        weights = np.zeros(len(cars))
+                    generator_idx = np.flatnonzero(np.isfinite(weights))
+                    if raster is not None:
+                        cells = raster.cells(fleet.pos[generator_idx], weights[generator_idx])
+                    else:
+                        cells = power_cells(fleet.pos[generator_idx], weights[generator_idx], boundary)
             else:
-                if not item.picked:
-                    dx = item.x - drone.x
-                    dy = item.y - drone.y
-                    distance = math.hypot(dx, dy)
-                    if distance <= drone.sensor_range:
-                        if not items_detected[idx]:
-                            print(f"Drone has detected item {idx + 1}.")
-                        item_point = Point(item.x, item.y)
-                        assigned = False
-                        for car, poly in car_polygons.items():
-                            if (poly and poly.contains(item_point)
-                                    and not car.has_item and not car.delivering
-                                    and not car.assigned_task):
-                                car.set_target(item)
-                                print(f"Car at ({car.x:.2f}, {car.y:.2f}) has been assigned to pick up item {idx + 1}.")
-                                assigned = True
-                                break
-                        if assigned:
-                            items_detected[idx] = True
-
-        for car in cars:
-            car.dx_total = 0
-            car.dy_total = 0
-
-        for car in cars:
-            polygon = car_polygons[car]
-            old_x, old_y = car.x, car.y
-
+                if voronoi:
+                    generator_idx = np.flatnonzero(~fleet.has(ASSIGNED))
+                else:
+                    generator_idx = np.arange(len(cars))
+                if kinetic is not None:
+                    with profiler.span('partition'):
+                        cells = kinetic.cells(fleet.pos[generator_idx], generator_idx)
+                elif len(generator_idx) > 0:
+                    with profiler.span('voronoi'):
+                        vor = Voronoi(fleet.pos[generator_idx])
+                    with profiler.span('closure'):
+                        _, vertices, indices, offsets = voronoi_finite_polygons_2d(vor, csr=True)
+                    with profiler.span('clip'):
+                        cells = clip_convex_cells(indices, offsets, vertices, boundary)
+                else:
+                    cells = Cells.empty()
+
+            # Free cars head for the centroid of their cell
+            owners = generator_idx[cells.valid]
             if voronoi:
-                car.update(cars, ENV_SIZE, polygon)
+                free = ~fleet.has_target_item()[owners] & ~fleet.has(DELIVERING)[owners]
             else:
-                car.update_nml(cars, ENV_SIZE, polygon)
-
-        # Calculate overlap
-        target_map = {}
-        for car in cars:
-            if car.target_item and not car.has_item:
-                target_map[car.target_item] = target_map.get(car.target_item, 0) + 1
-        frame_overlap = 0
-        for count in target_map.values():
-            if count > 1:
-                frame_overlap += (count - 1)
-        sum_task_overlap += frame_overlap
-
-        deliveries = False
-        busy_cars_count = 0
-
-        for i, car in enumerate(cars):
-            total_speed = math.hypot(car.dx_total, car.dy_total)
-            if total_speed > car.speed:
-                scale = car.speed / total_speed
-                car.dx_total *= scale
-                car.dy_total *= scale
-
-            old_x, old_y = car.x, car.y
-            car.x += car.dx_total
-            car.y += car.dy_total
-
-            distance_moved = math.hypot(car.x - car.last_x, car.y - car.last_y)
-            total_distance_cars[i] += distance_moved
-            car.last_x, car.last_y = car.x, car.y
-
-            # Delivery check
-            if car.delivering:
-                dx = car.centroid[0] - car.x
-                dy = car.centroid[1] - car.y
-                distance_to_target = math.hypot(dx, dy)
-                if distance_to_target < car.speed:
-                    # Compute lifecycle
-                    if car.current_item is not None:
-                        delivery_time_diffs.append(frame_count - appear_time_dict[car.current_item])
+                free = fleet.idle()[owners]
+            fleet.target[owners[free]] = cells.centroids[cells.valid][free]
+
+            # Attempt item assignment
+            detected = []
+            with profiler.span('detect'):
+                for serial in scheduler.due(tick):
+                    item = store.get(serial)
+                    if item is None or item.picked:
+                        continue
+                    if events.enabled and (voronoi or store.frame_of(serial, 'assign') < 0):
+                        events.emit(DETECT, item=serial)
+                    store.record(serial, 'detect', tick)
+                    if not voronoi:
+                        # Keep offering the item while it stays in range and unpicked
+                        scheduler.schedule(serial, item.x, item.y, tick + 1)
+                    detected.append(item)
+
+            if batch is not None:
+                for item in detected:
+                    if store.frame_of(item.serial, 'assign') < 0:
+                        batch.offer(item, tick)
+                if batch.ready(tick):
+                    with profiler.span('assign'):
+                        if voronoi:
+                            takers = np.flatnonzero(~fleet.has(ASSIGNED))
+                        else:
+                            takers = np.flatnonzero(~fleet.has(HAS_ITEM | DELIVERING | ASSIGNED))
+                        pending = batch.pending()
+                        owners = batch.match([(item.x, item.y) for item in pending], fleet.pos[takers],
+                                             takers, metrics.task_counts[takers])
+                        for item, owner in zip(pending, owners):
+                            if owner < 0:
+                                continue
+                            cars[owner].set_target(item)
+                            store.record(item.serial, 'assign', tick, car=owner)
+                            metrics.assign(owner, item.serial)
+                            batch.settle(item)
+            elif detected:
+                with profiler.span('assign'):
+                    if weights is None:
+                        assigner = NearestAssigner(fleet.pos[generator_idx], generator_idx)
+                    else:
+                        # Busy cars keep their (small) cell but take no new items
+                        takers = generator_idx[~fleet.has(ASSIGNED)[generator_idx]] if voronoi else generator_idx
+                        assigner = NearestAssigner(fleet.pos[takers], takers, weights[takers])
+                    owners = assigner.query([(item.x, item.y) for item in detected])
+                    for item, owner in zip(detected, owners):
+                        if owner < 0:
+                            continue
+                        car = cars[owner]
+                        if voronoi or not (car.has_item or car.delivering or car.assigned_task):
+                            car.set_target(item)
+                            store.record(item.serial, 'assign', tick, car=owner)
+                            metrics.assign(owner, item.serial)
+
+            # Calculate overlap
+            metrics.sample_overlap()
+
+            for step_tick in range(first_tick, tick + 1):
+                events.frame = step_tick
+                with profiler.span('step'):
+                    picked, delivered = fleet.step()
+
+                with profiler.span('bookkeeping'):
+                    for i in picked:
+                        store.record(cars[i].current_item.serial, 'pickup', step_tick)
+                        metrics.pickup(i)
+
+                    # Compute lifecycle and archive delivered items
+                    for i in delivered:
+                        car = cars[i]
+                        lifecycle = None
+                        if car.current_item is not None and store.get(car.current_item.serial) is not None:
+                            row = store.finish(car.current_item.serial, step_tick)
+                            lifecycle = step_tick - row['appear']
                         car.current_item = None
-
-                    car.has_item = False
-                    car.delivering = False
-                    car.item_color = None
-                    car.just_delivered = True
-                    car.assigned_task = False
-                    print(f"Car at({car.x:.2f}, {car.y:.2f}) has delivered the item.")
-
-            # Pickup check
-            if car.target_item and not car.has_item:
-                dx_item = car.target_item.x - car.x
-                dy_item = car.target_item.y - car.y
-                distance = math.hypot(dx_item, dy_item)
-                if distance < car.size + car.target_item.size:
-                    car.has_item = True
-                    car.item_color = car.target_item.color
-                    car.target_item.picked = True
-                    car.current_item = car.target_item
-                    car.target_item = None
-                    print(f"Car at ({car.x:.2f}, {car.y:.2f}) has picked up the item.")
-
-            # Idle check
-            if (not car.assigned_task and not car.delivering
-                    and not car.target_item and not car.has_item):
-                car_idle_frames[i] += 1
-
-            if car.just_delivered:
-                deliveries = True
-                car.just_delivered = False
-                car_task_counts.append(i)
-                deliveries_count += 1
-
-            if car.assigned_task or car.delivering:
-                busy_cars_count += 1
-
-        sum_busy_cars += busy_cars_count
-
-        # New item after delivery
-        if deliveries:
-            new_item = Item(ENV_SIZE)
-            items.append(new_item)
-            items_detected.append(False)
-            appear_time_dict[new_item] = frame_count
-            print("A new item has appeared.")
-
-        # Record data each frame
-        boxes_delivered_list.append(deliveries_count)
-        task_count_array = [0]*len(cars)
-        for car_index in car_task_counts:
-            task_count_array[car_index] += 1
-        if len(task_count_array) > 1:
-            current_std_task = np.std(task_count_array)
-        else:
-            current_std_task = 0.0
-        std_task_list.append(current_std_task)
-
-        total_idle_frames = sum(car_idle_frames)
-        total_car_frames = frame_count * len(cars)
-        current_idle_ratio = (total_idle_frames / total_car_frames) if total_car_frames > 0 else 0
-        idle_ratio_list.append(current_idle_ratio)
-
-        if len(items) > 0:
-            current_box_delivery_eff = (deliveries_count / len(items)) * 100
-        else:
-            current_box_delivery_eff = 0
-        box_delivery_eff_list.append(current_box_delivery_eff)
-
-        busy_cars_list.append(busy_cars_count)
-
-        screen.fill((255, 255, 255))
-        draw_quarter_circle(screen, (ENV_SIZE, ENV_SIZE), 40, (255, 182, 193), ENV_SIZE)
-
-        if voronoi:
-            if vor is not None:
-                for poly in car_polygons.values():
-                    if poly and poly.exterior:
-                        x, y = poly.exterior.xy
-                        coords = [(int(xx), int(yy)) for xx, yy in zip(x, y)]
-                        pygame.draw.polygon(screen, (0, 255, 0), coords, 1)
-        else:
-            for poly in car_polygons.values():
-                if poly and poly.exterior:
-                    x, y = poly.exterior.xy
-                    coords = [(int(xx), int(yy)) for xx, yy in zip(x, y)]
-                    pygame.draw.polygon(screen, (0, 255, 0), coords, 1)
-
-        drone.draw(screen)
-        for car in cars:
-            car.draw(screen)
-        for item in items:
-            item.draw(screen)
-
-        pygame.display.flip()
-        clock.tick(FPS)
-
-        if frame_count >= FRAMES_PER_MINUTE:
-            running = False
-
-    pygame.quit()
-
-    # Final metrics
-    boxes_per_minute = deliveries_count
-    task_count_array = [0]*len(cars)
-    for car_index in car_task_counts:
-        task_count_array[car_index] += 1
-    if len(task_count_array) > 1:
-        std_task = np.std(task_count_array)
-    else:
-        std_task = 0.0
-
-    total_idle_frames = sum(car_idle_frames)
-    total_car_frames = FRAMES_PER_MINUTE * len(cars)
-    idle_ratio = total_idle_frames / total_car_frames if total_car_frames > 0 else 0
-
-    box_delivery_efficiency = (deliveries_count / len(items))*100 if len(items)>0 else 0
-
-    total_dist_all_cars = sum(total_distance_cars)
+                        metrics.deliver(i, lifecycle)
+
+                    # New item after delivery
+                    if len(delivered) > 0:
+                        new_item = Item(ENV_SIZE, rng, demand)
+                        serial = store.add(new_item, step_tick)
+                        scheduler.schedule(serial, new_item.x, new_item.y, step_tick + 1)
+                        if events.enabled:
+                            events.emit(SPAWN, item=serial, x=new_item.x, y=new_item.y)
+
+            with profiler.span('bookkeeping'):
+                busy_cars_count = int(np.count_nonzero(fleet.busy()))
+                metrics.end_frame(int(np.count_nonzero(fleet.idle())), busy_cars_count)
+
+            # Record data each frame
+            with profiler.span('record'):
+                series.append(metrics.deliveries, metrics.task_std, metrics.idle_ratio(),
+                              metrics.box_efficiency(store.created), busy_cars_count)
+                if recorder is not None:
+                    on_ground = [(item.x, item.y) for item in store.live() if not item.picked]
+                    recorder.append(np.column_stack([drone.x, drone.y]), fleet.pos, fleet.state, on_ground, cells)
+
+            if not headless:
+                with profiler.span('draw'):
+                    rects = renderer.draw_live(screen, drone, fleet, store.live(), cells)
+                if overlay is not None:
+                    with profiler.span('overlay'):
+                        rects = renderer.touch(rects, overlay.draw(screen))
+                if exporter is not None and exporter.wants(frame_count):
+                    with profiler.span('export'):
+                        exporter.submit(frame_count, screen)
+
+                with profiler.span('display'):
+                    pygame.display.update(rects)
+                clock.tick(sim.frame_rate)
+            elif exporter is not None and exporter.wants(frame_count):
+                with profiler.span('export'):
+                    export_renderer.draw_live(exporter.surface, drone, fleet, store.live(), cells)
+                    exporter.submit(frame_count)
+
+            if frame_count >= n_frames:
+                running = False
+    finally:
+        # Keep what was recorded even if the run is interrupted
+        series.close()
+        if recorder is not None:
+            recorder.close()
+        if own_events:
+            events.close()
+        store.archive.flush()
+        if own_lifecycle:
+            os.remove(lifecycle_path)
+
+    if not headless:
+        pygame.quit()
+
+    # Final metrics, per simulated minute
+    boxes_per_minute = metrics.deliveries / (n_frames / sim.frame_rate / 60)
+    if boxes_per_minute.is_integer():
+        # A whole number of boxes (e.g. a one-minute run) stays an int, as in the original output
+        boxes_per_minute = int(boxes_per_minute)
+    std_task = metrics.task_std
+    idle_ratio = metrics.idle_ratio(n_frames * len(cars))
+    box_delivery_efficiency = metrics.box_efficiency(store.created)
+
+    total_dist_all_cars = sum(fleet.odometer.tolist())
     avg_distance_per_car = total_dist_all_cars / len(cars) if len(cars)>0 else 0
 
-    if len(delivery_time_diffs) > 0:
-        avg_box_lifecycle = sum(delivery_time_diffs)/len(delivery_time_diffs)/60
-    else:
-        avg_box_lifecycle = 0.0
-
-    avg_busy_cars = sum_busy_cars / frame_count if frame_count>0 else 0
+    avg_box_lifecycle = metrics.avg_lifecycle(sim.rate)
+    avg_busy_cars = metrics.avg_busy()
 
     # Create final dictionary
     results = {
@@ -336,76 +369,208 @@ def run_experiment(voronoi=True):
         'Average Busy Cars': avg_busy_cars
     }
 
-    time_axis = np.arange(len(boxes_delivered_list)) / FPS
-
-    return (time_axis, boxes_delivered_list, std_task_list, idle_ratio_list,
-            box_delivery_eff_list, busy_cars_list, results)
-
-# Run Experiment nml
-(time_axis_nml, boxes_delivered_nml, std_task_nml, idle_ratio_nml,
- box_delivery_eff_nml, busy_cars_nml, results_nml) = run_experiment(voronoi=False)
-
-# Run Experiment voronoi
-(time_axis_vor, boxes_delivered_vor, std_task_vor, idle_ratio_vor,
- box_delivery_eff_vor, busy_cars_vor, results_vor) = run_experiment(voronoi=True)
-
-print("========== Experiment nml Final Results ==========")
-for k, v in results_nml.items():
-    print(f"{k}: {v}")
-print("====================================")
-
-print("========== Experiment vor Final Results ==========")
-for k, v in results_vor.items():
-    print(f"{k}: {v}")
-print("====================================")
-
-# Plot comparisons (titles/labels remain in English)
-plt.figure(figsize=(12, 10))
-
-plt.subplot(3, 2, 1)
-plt.plot(time_axis_nml, boxes_delivered_nml, label='Exp_nml', color='blue')
-plt.plot(time_axis_vor, boxes_delivered_vor, label='Exp_vor', color='red', linestyle='--')
-plt.xlabel('Time (s)')
-plt.ylabel('Cumulative Boxes Delivered')
-plt.title('Boxes Delivered Over Time')
-plt.grid(True)
-plt.legend()
-
-plt.subplot(3, 2, 2)
-plt.plot(time_axis_nml, std_task_nml, label='Exp_nml', color='blue')
-plt.plot(time_axis_vor, std_task_vor, label='Exp_vor', color='red', linestyle='--')
-plt.xlabel('Time (s)')
-plt.ylabel('Std of Task Counts')
-plt.title('Task Distribution Efficiency Over Time')
-plt.grid(True)
-plt.legend()
-
-plt.subplot(3, 2, 3)
-plt.plot(time_axis_nml, idle_ratio_nml, label='Exp_nml', color='blue')
-plt.plot(time_axis_vor, idle_ratio_vor, label='Exp_vor', color='red', linestyle='--')
-plt.xlabel('Time (s)')
-plt.ylabel('Idle Time Ratio')
-plt.title('Idle Time Ratio Over Time')
-plt.grid(True)
-plt.legend()
-
-plt.subplot(3, 2, 4)
-plt.plot(time_axis_nml, box_delivery_eff_nml, label='Exp_nml', color='blue')
-plt.plot(time_axis_vor, box_delivery_eff_vor, label='Exp_vor', color='red', linestyle='--')
-plt.xlabel('Time (s)')
-plt.ylabel('Box Delivery Efficiency (%)')
-plt.title('Box Delivery Efficiency Over Time')
-plt.grid(True)
-plt.legend()
-
-plt.subplot(3, 2, 5)
-plt.plot(time_axis_nml, busy_cars_nml, label='Exp_nml', color='blue')
-plt.plot(time_axis_vor, busy_cars_vor, label='Exp_vor', color='red', linestyle='--')
-plt.xlabel('Time (s)')
-plt.ylabel('Number of Busy Cars')
-plt.title('Busy Cars Over Time')
-plt.grid(True)
-plt.legend()
-
-plt.tight_layout()
-plt.show()
\ No newline at end of file
+    time_axis = np.arange(series.rows) / sim.frame_rate
+
+    return (time_axis,) + tuple(series.column(name) for name, _ in SERIES_COLUMNS) + (results,)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare fixed and dynamic VSP-based task allocation.")
+    parser.add_argument('--headless', action='store_true',
+                        help='run without a display and without frame throttling')
+    parser.add_argument('--save', default=None,
+                        help='save the comparison figure to this path instead of only showing it')
+    parser.add_argument('--series-dir', default=None,
+                        help='stream per-frame metrics of each run into <dir>/nml and <dir>/vor')
+    parser.add_argument('--record-dir', default=None,
+                        help='record every frame of each run into <dir>/nml and <dir>/vor for replay.py')
+    parser.add_argument('--export', default=None,
+                        help='export frames of each run as <name>_nml.gif / <name>_vor.gif, or as PNG '
+                             'sequences into <dir>/nml and <dir>/vor if the path does not end in .gif')
+    parser.add_argument('--export-every', type=int, default=6, help='export every k-th frame')
+    parser.add_argument('--export-scale', type=float, default=0.5, help='scale factor of exported frames')
+    parser.add_argument('--partition', choices=['voronoi', 'power', 'kinetic', 'raster'], default='voronoi',
+                        help='space partition: scipy Voronoi, the weighted power diagram, the '
+                             'kinetic Voronoi diagram that skips unneeded rebuilds or a labelled raster')
+    parser.add_argument('--raster-resolution', type=float, default=10.0,
+                        help='grid cell size of the raster partition')
+    parser.add_argument('--demand', default=None,
+                        help='.npy file with a 2-D item probability raster (default: uniform)')
+    parser.add_argument('--assigned-weight', type=float, default=None,
+                        help='power weight of cars with a task (default: drop them from the diagram)')
+    parser.add_argument('--speed-horizon', type=float, default=0.0,
+                        help='seconds of travel that set the power weight of free cars')
+    parser.add_argument('--assign', choices=['nearest', 'batch'], default='nearest',
+                        help='give each detected item to the owner of its cell, or match batches of '
+                             'items to free cars with linear_sum_assignment')
+    parser.add_argument('--batch-window', type=float, default=0.0,
+                        help='seconds detected items are collected before a batch is matched')
+    parser.add_argument('--batch-candidates', type=int, default=8,
+                        help='nearest cars considered for each item of a batch')
+    parser.add_argument('--workload-cost', type=float, default=50.0,
+                        help='distance added per task a car has delivered when matching batches')
+    parser.add_argument('--dt', type=float, default=1 / 60, help='physics time step in simulated seconds')
+    parser.add_argument('--substeps', type=int, default=1, help='physics steps per partition/render frame')
+    parser.add_argument('--duration', type=float, default=60.0, help='simulated seconds per run')
+    parser.add_argument('--drones', type=int, default=None,
+                        help='number of drones sweeping their own regions (default: one zigzag drone)')
+    parser.add_argument('--drone-layout', choices=DRONE_LAYOUTS, default='strips',
+                        help='how the workspace is split between the drones')
+    parser.add_argument('--profile', default=None,
+                        help='time every stage of the frame loop and dump the histograms to <path>.nml.json / <path>.vor.json')
+    parser.add_argument('--profile-overlay', action='store_true',
+                        help='draw the stage timings on the simulation window')
+    parser.add_argument('--event-log', default=None,
+                        help='write simulation events of each run as JSON lines to <path>.nml / <path>.vor')
+    parser.add_argument('--log-level', choices=sorted(LEVELS), default='debug',
+                        help='lowest event level that is recorded')
+    parser.add_argument('--lifecycle', default=None,
+                        help='archive the lifecycle rows of delivered items to <path>.nml / <path>.vor '
+                             '(default: a temporary file)')
+    parser.add_argument('--quiet', action='store_true', help='do not print simulation events')
+    args = parser.parse_args()
+    if args.headless:
+        plt.switch_backend('Agg')
+
+    def series_path(mode):
+        return os.path.join(args.series_dir, mode) if args.series_dir else None
+
+    def record_path(mode):
+        return os.path.join(args.record_dir, mode) if args.record_dir else None
+
+    frame_rate = SimClock(args.dt, args.substeps).frame_rate
+
+    def exporter(mode):
+        if not args.export:
+            return None
+        root, ext = os.path.splitext(args.export)
+        path = f"{root}_{mode}{ext}" if ext.lower() == '.gif' else os.path.join(args.export, mode)
+        return FrameExporter(path, 800, every=args.export_every, fps=frame_rate,
+                             scale=args.export_scale)
+
+    def lifecycle_path(mode):
+        return f"{args.lifecycle}.{mode}" if args.lifecycle else None
+
+    def event_log(mode):
+        consumers = [] if args.quiet else [ConsoleSink()]
+        if args.event_log:
+            consumers.append(JsonlSink(f"{args.event_log}.{mode}"))
+        return EventLog(consumers, level=LEVELS[args.log_level])
+
+    partition_args = {'partition': args.partition, 'assigned_weight': args.assigned_weight,
+                      'speed_horizon': args.speed_horizon, 'raster_resolution': args.raster_resolution,
+                      'demand': DemandMap.load(args.demand, 800) if args.demand else None}
+    clock_args = {'dt': args.dt, 'substeps': args.substeps, 'duration': args.duration}
+    assign_args = {'assign': args.assign, 'batch_window': args.batch_window,
+                   'batch_candidates': args.batch_candidates, 'workload_cost': args.workload_cost}
+    drone_args = {'drones': args.drones, 'drone_layout': args.drone_layout}
+
+    def profiler():
+        return Profiler(enabled=bool(args.profile) or args.profile_overlay)
+
+    def dump_profile(profiler, mode):
+        if profiler.enabled:
+            print(f"========== Experiment {mode} stage timings ==========")
+            print(profiler.report())
+        if args.profile:
+            profiler.dump(f"{args.profile}.{mode}.json")
+
+    # Run Experiment nml
+    events_nml = event_log('nml')
+    exporter_nml = exporter('nml')
+    profiler_nml = profiler()
+    try:
+        (time_axis_nml, boxes_delivered_nml, std_task_nml, idle_ratio_nml,
+         box_delivery_eff_nml, busy_cars_nml, results_nml) = run_experiment(
+            voronoi=False, headless=args.headless, series_path=series_path('nml'), events=events_nml,
+            record_path=record_path('nml'), exporter=exporter_nml,
+            profiler=profiler_nml, overlay=args.profile_overlay, **partition_args, **clock_args,
+            **drone_args, **assign_args, lifecycle_path=lifecycle_path('nml'))
+    finally:
+        events_nml.close()
+        if exporter_nml is not None:
+            exporter_nml.close()
+    dump_profile(profiler_nml, 'nml')
+
+    # Run Experiment voronoi
+    events_vor = event_log('vor')
+    exporter_vor = exporter('vor')
+    profiler_vor = profiler()
+    try:
+        (time_axis_vor, boxes_delivered_vor, std_task_vor, idle_ratio_vor,
+         box_delivery_eff_vor, busy_cars_vor, results_vor) = run_experiment(
+            voronoi=True, headless=args.headless, series_path=series_path('vor'), events=events_vor,
+            record_path=record_path('vor'), exporter=exporter_vor,
+            profiler=profiler_vor, overlay=args.profile_overlay, **partition_args, **clock_args,
+            **drone_args, **assign_args, lifecycle_path=lifecycle_path('vor'))
+    finally:
+        events_vor.close()
+        if exporter_vor is not None:
+            exporter_vor.close()
+    dump_profile(profiler_vor, 'vor')
+
+    print("========== Experiment nml Final Results ==========")
+    for k, v in results_nml.items():
+        print(f"{k}: {v}")
+    print("====================================")
+
+    print("========== Experiment vor Final Results ==========")
+    for k, v in results_vor.items():
+        print(f"{k}: {v}")
+    print("====================================")
+
+    # Plot comparisons (titles/labels remain in English)
+    plt.figure(figsize=(12, 10))
+
+    plt.subplot(3, 2, 1)
+    plt.plot(time_axis_nml, boxes_delivered_nml, label='Exp_nml', color='blue')
+    plt.plot(time_axis_vor, boxes_delivered_vor, label='Exp_vor', color='red', linestyle='--')
+    plt.xlabel('Time (s)')
+    plt.ylabel('Cumulative Boxes Delivered')
+    plt.title('Boxes Delivered Over Time')
+    plt.grid(True)
+    plt.legend()
+
+    plt.subplot(3, 2, 2)
+    plt.plot(time_axis_nml, std_task_nml, label='Exp_nml', color='blue')
+    plt.plot(time_axis_vor, std_task_vor, label='Exp_vor', color='red', linestyle='--')
+    plt.xlabel('Time (s)')
+    plt.ylabel('Std of Task Counts')
+    plt.title('Task Distribution Efficiency Over Time')
+    plt.grid(True)
+    plt.legend()
+
+    plt.subplot(3, 2, 3)
+    plt.plot(time_axis_nml, idle_ratio_nml, label='Exp_nml', color='blue')
+    plt.plot(time_axis_vor, idle_ratio_vor, label='Exp_vor', color='red', linestyle='--')
+    plt.xlabel('Time (s)')
+    plt.ylabel('Idle Time Ratio')
+    plt.title('Idle Time Ratio Over Time')
+    plt.grid(True)
+    plt.legend()
+
+    plt.subplot(3, 2, 4)
+    plt.plot(time_axis_nml, box_delivery_eff_nml, label='Exp_nml', color='blue')
+    plt.plot(time_axis_vor, box_delivery_eff_vor, label='Exp_vor', color='red', linestyle='--')
+    plt.xlabel('Time (s)')
+    plt.ylabel('Box Delivery Efficiency (%)')
+    plt.title('Box Delivery Efficiency Over Time')
+    plt.grid(True)
+    plt.legend()
+
+    plt.subplot(3, 2, 5)
+    plt.plot(time_axis_nml, busy_cars_nml, label='Exp_nml', color='blue')
+    plt.plot(time_axis_vor, busy_cars_vor, label='Exp_vor', color='red', linestyle='--')
+    plt.xlabel('Time (s)')
+    plt.ylabel('Number of Busy Cars')
+    plt.title('Busy Cars Over Time')
+    plt.grid(True)
+    plt.legend()
+
+    plt.tight_layout()
+    if args.save:
+        plt.savefig(args.save)
+    if not args.headless:
+        plt.show()
+
+if __name__ == '__main__':
+    main()
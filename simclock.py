@@ -0,0 +1,33 @@
+class SimClock:
+    """Fixed-timestep simulation clock.
+
+    The physics advances in steps of dt simulated seconds; every frame (one
+    partition update, one detection pass and at most one render) runs
+    `substeps` of them. Speeds are given in units per second; the fleet and
+    the drones are built with the clock's dt and scale them to a step
+    themselves.
+
+    ticks counts physics steps and frames counts frames; item events and
+    detection times are kept in ticks.
+    """
+    def __init__(self, dt=1 / 60, substeps=1):
+        if dt <= 0 or substeps < 1:
+            raise ValueError(f"need dt > 0 and substeps >= 1, got dt={dt}, substeps={substeps}")
+        self.dt = dt
+        self.substeps = int(substeps)
+        self.rate = 1 / dt
+        self.frame_rate = self.rate / self.substeps
+        self.ticks = 0
+        self.frames = 0
+
+    def frames_in(self, seconds):
+        """Number of frames that simulate the given duration."""
+        return max(1, round(seconds * self.frame_rate))
+
+    def tick(self):
+        self.ticks += 1
+        return self.ticks
+
+    def new_frame(self):
+        self.frames += 1
+        return self.frames
@@ -0,0 +1,103 @@
+import json
+import os
+import numpy as np
+
+META_FILE = 'meta.json'
+
+
+class SeriesWriter:
+    """Chunked, append-only columnar writer for per-frame metrics.
+
+    Rows go into preallocated per-column NumPy buffers. Every chunk_size rows
+    the buffers are flushed: with a path, each column is appended to its own
+    raw file in that directory (readable with SeriesReader while the run is
+    still going); without one, chunks are kept in memory as packed arrays.
+    """
+    def __init__(self, columns, path=None, chunk_size=256, attrs=None):
+        self.columns = [(name, np.dtype(dtype)) for name, dtype in columns]
+        self.path = path
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self._used = 0
+        self._buffers = {name: np.empty(chunk_size, dtype=dtype) for name, dtype in self.columns}
+        self._chunks = {name: [] for name, _ in self.columns}
+        self._files = {}
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            meta = {
+                'columns': [{'name': name, 'dtype': dtype.str} for name, dtype in self.columns],
+                'attrs': attrs or {},
+            }
+            with open(os.path.join(path, META_FILE), 'w') as f:
+                json.dump(meta, f, indent=2)
+            for name, _ in self.columns:
+                self._files[name] = open(os.path.join(path, name + '.bin'), 'wb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, *values):
+        """Append one row, with values in column order."""
+        for (name, _), value in zip(self.columns, values):
+            self._buffers[name][self._used] = value
+        self._used += 1
+        self.rows += 1
+        if self._used == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._used == 0:
+            return
+        for name, _ in self.columns:
+            data = self._buffers[name][:self._used]
+            if self.path is None:
+                self._chunks[name].append(data.copy())
+            else:
+                data.tofile(self._files[name])
+                self._files[name].flush()
+        self._used = 0
+
+    def close(self):
+        self.flush()
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    def column(self, name):
+        """Every row written so far for one column."""
+        if self.path is not None:
+            self.flush()
+            return SeriesReader(self.path).column(name)
+        return np.concatenate(self._chunks[name] + [self._buffers[name][:self._used]])
+
+
+class SeriesReader:
+    """Zero-copy reader for a SeriesWriter directory, also while it is being written.
+
+    The number of rows is recomputed from the column file sizes on every call,
+    so a live plot can simply call column() again to see new data.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        self.columns = [(c['name'], np.dtype(c['dtype'])) for c in meta['columns']]
+        self.attrs = meta['attrs']
+
+    def _file(self, name):
+        return os.path.join(self.path, name + '.bin')
+
+    def __len__(self):
+        """Rows present in every column file."""
+        return min(os.path.getsize(self._file(name)) // dtype.itemsize
+                   for name, dtype in self.columns)
+
+    def column(self, name):
+        dtype = dict(self.columns)[name]
+        rows = len(self)
+        if rows == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self._file(name), dtype=dtype, mode='r', shape=(rows,))
@@ -2,48 +2,161 @@ import random
 import pygame
 import math
 import numpy as np
+from shapely.geometry import Polygon
 
-def voronoi_finite_polygons_2d(vor, radius=None):
+def uniform(rng, low, high):
+    """Draw from a NumPy Generator, or from the global random module if rng is None."""
+    if rng is None:
+        return random.uniform(low, high)
+    return float(rng.uniform(low, high))
+
+def voronoi_finite_polygons_2d(vor, radius=None, csr=False):
+    """Close the infinite regions of a 2-D Voronoi diagram.
+
+    Every infinite ridge is cut off at a far point `radius` away from its
+    finite vertex. All ridges are handled at once and the vertices of every
+    region are put in counter-clockwise order with a single lexsort.
+
+    Returns (regions, vertices), where regions[p] lists the vertex indices of
+    the cell of input point p. With csr=True, (indices, offsets) are returned
+    as well, where the cell of point p is indices[offsets[p]:offsets[p + 1]].
+    """
     if radius is None:
         radius = 800 * 2
-    new_regions = []
-    new_vertices = vor.vertices.tolist()
-
-    center = vor.points.mean(axis=0)
-    all_ridges = {}
-    for (p1, p2), (v1, v2) in zip(vor.ridge_points, vor.ridge_vertices):
-        all_ridges.setdefault(p1, []).append((p2, v1, v2))
-        all_ridges.setdefault(p2, []).append((p1, v1, v2))
-
-    for p1, region in enumerate(vor.point_region):
-        vertices = vor.regions[region]
-        if all(v >= 0 for v in vertices):
-            new_regions.append(vertices)
-            continue
-
-        ridges = all_ridges[p1]
-        new_region = [v for v in vertices if v >= 0]
-        for p2, v1, v2 in ridges:
-            if v2 < 0:
-                v1, v2 = v2, v1
-            if v1 >= 0:
-                continue
-            t = vor.points[p2 % len(vor.points)] - vor.points[p1 % len(vor.points)]
-            t /= np.linalg.norm(t)
-            n = np.array([-t[1], t[0]])
-            midpoint = vor.points[[p1 % len(vor.points), p2 % len(vor.points)]].mean(axis=0)
-            direction = np.sign(np.dot(midpoint - center, n)) * n
-            far_point = vor.vertices[v2] + direction * radius
-            new_vertices.append(far_point.tolist())
-            new_region.append(len(new_vertices) - 1)
-
-        vs = np.asarray([new_vertices[v] for v in new_region])
-        c = vs.mean(axis=0)
-        angles = np.arctan2(vs[:,1]-c[1], vs[:,0]-c[0])
-        new_region = [v for _,v in sorted(zip(angles, new_region))]
-        new_regions.append(new_region)
-        
-    return new_regions, np.array(new_vertices)
+    points = vor.points
+    n = len(points)
+    ridge_points = np.asarray(vor.ridge_points)
+    ridge_vertices = np.asarray(vor.ridge_vertices)
+    center = points.mean(axis=0)
+
+    # Far points for ridges with exactly one vertex at infinity
+    infinite = (ridge_vertices < 0).any(axis=1) & (ridge_vertices >= 0).any(axis=1)
+    p1, p2 = ridge_points[infinite, 0], ridge_points[infinite, 1]
+    v_finite = ridge_vertices[infinite].max(axis=1)
+    t = points[p2] - points[p1]
+    t /= np.hypot(t[:, 0], t[:, 1])[:, None]
+    normal = np.column_stack([-t[:, 1], t[:, 0]])
+    midpoint = (points[p1] + points[p2]) / 2
+    side = np.sign(np.einsum('ij,ij->i', midpoint - center, normal))
+    far_points = vor.vertices[v_finite] + side[:, None] * normal * radius
+    vertices = np.concatenate([vor.vertices, far_points.reshape(-1, 2)])
+    far_idx = len(vor.vertices) + np.arange(len(far_points))
+
+    # (point, vertex) incidences from both sides of every ridge
+    owner = np.concatenate([ridge_points[:, 0], ridge_points[:, 1],
+                            ridge_points[:, 0], ridge_points[:, 1], p1, p2])
+    vertex = np.concatenate([ridge_vertices[:, 0], ridge_vertices[:, 0],
+                             ridge_vertices[:, 1], ridge_vertices[:, 1], far_idx, far_idx])
+    keep = vertex >= 0
+    key = np.unique(owner[keep].astype(np.int64) * len(vertices) + vertex[keep])
+    owner, vertex = key // len(vertices), key % len(vertices)
+
+    counts = np.bincount(owner, minlength=n)
+    cx = np.bincount(owner, vertices[vertex, 0], n) / np.maximum(counts, 1)
+    cy = np.bincount(owner, vertices[vertex, 1], n) / np.maximum(counts, 1)
+    angles = np.arctan2(vertices[vertex, 1] - cy[owner], vertices[vertex, 0] - cx[owner])
+    order = np.lexsort((angles, owner))
+    indices = vertex[order]
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    regions = [region.tolist() for region in np.split(indices, offsets[1:-1])]
+    if csr:
+        return regions, vertices, indices, offsets
+    return regions, vertices
+
+def box_boundary(min_x, min_y, max_x, max_y):
+    """Counter-clockwise vertex array of an axis-aligned rectangle."""
+    return np.array([(min_x, min_y), (max_x, min_y), (max_x, max_y), (min_x, max_y)], dtype=float)
+
+def _next_vertex(offsets):
+    """Index of the following vertex, wrapping around inside each polygon."""
+    counts = np.diff(offsets)
+    nxt = np.arange(1, offsets[-1] + 1)
+    nonempty = counts > 0
+    nxt[offsets[1:][nonempty] - 1] = offsets[:-1][nonempty]
+    return nxt
+
+def _clip_half_plane(points, offsets, a, b):
+    """Clip every polygon to the left of the directed edge a -> b."""
+    n = len(offsets) - 1
+    owner = np.repeat(np.arange(n), np.diff(offsets))
+    nxt = _next_vertex(offsets)
+    edge = b - a
+    side = edge[0] * (points[:, 1] - a[1]) - edge[1] * (points[:, 0] - a[0])
+    inside = side >= 0
+    crossing = inside != inside[nxt]
+
+    # Each vertex emits itself if inside, then the crossing point if any
+    emit = inside.astype(np.int64) + crossing
+    start = np.cumsum(emit) - emit
+    clipped = np.empty((emit.sum(), 2))
+    clipped[start[inside]] = points[inside]
+    k = np.flatnonzero(crossing)
+    t = side[k] / (side[k] - side[nxt[k]])
+    clipped[start[k] + inside[k]] = points[k] + t[:, None] * (points[nxt[k]] - points[k])
+    new_offsets = np.concatenate([[0], np.cumsum(np.bincount(owner, emit, n).astype(np.int64))])
+    return clipped, new_offsets
+
+def polygon_areas_centroids(points, offsets):
+    """Areas and centroids of every polygon in a CSR layout (shoelace formula)."""
+    n = len(offsets) - 1
+    owner = np.repeat(np.arange(n), np.diff(offsets))
+    nxt = points[_next_vertex(offsets)]
+    cross = points[:, 0] * nxt[:, 1] - nxt[:, 0] * points[:, 1]
+    twice_area = np.bincount(owner, cross, n)
+    moment_x = np.bincount(owner, (points[:, 0] + nxt[:, 0]) * cross, n)
+    moment_y = np.bincount(owner, (points[:, 1] + nxt[:, 1]) * cross, n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        centroids = np.column_stack([moment_x, moment_y]) / (3 * twice_area)[:, None]
+    return np.abs(twice_area) / 2, centroids
+
+class Cells:
+    """Clipped cells of a whole fleet, stored in a flat CSR layout.
+
+    The cell of generator k has vertices points[offsets[k]:offsets[k + 1]].
+    Shapely polygons are only built when polygon() is called.
+    """
+    def __init__(self, points, offsets, areas, centroids):
+        self.points = points
+        self.offsets = offsets
+        self.areas = areas
+        self.centroids = centroids
+        self.valid = (np.diff(offsets) >= 3) & (areas > 1e-9)
+        self._polygons = {}
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros((0, 2)), np.zeros(1, dtype=np.int64), np.zeros(0), np.zeros((0, 2)))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def vertices(self, k):
+        return self.points[self.offsets[k]:self.offsets[k + 1]]
+
+    def polygon(self, k):
+        """Shapely polygon of cell k, or None if the cell is empty."""
+        if not self.valid[k]:
+            return None
+        if k not in self._polygons:
+            self._polygons[k] = Polygon(self.vertices(k))
+        return self._polygons[k]
+
+def clip_convex_cells(indices, offsets, vertices, boundary):
+    """Clip every convex cell against a convex boundary in one batch.
+
+    indices/offsets is the CSR output of voronoi_finite_polygons_2d and
+    boundary a counter-clockwise vertex array such as box_boundary(). The
+    cells are clipped with Sutherland-Hodgman, one boundary edge at a time
+    for all cells at once.
+    """
+    points = vertices[indices].reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    boundary = np.asarray(boundary, dtype=float)
+    for a, b in zip(boundary, np.roll(boundary, -1, axis=0)):
+        points, offsets = _clip_half_plane(points, offsets, a, b)
+    areas, centroids = polygon_areas_centroids(points, offsets)
+    return Cells(points, offsets, areas, centroids)
 
 def draw_quarter_circle(screen, center, radius, color, ENV_SIZE):
     """Draw a quarter circle in the bottom-right corner."""